@@ -0,0 +1,284 @@
+#!/usr/bin/env python3
+"""
+batch_simulation.py - Run MD simulations for many proteins across GPUs with Amber
+
+Each PDB file runs the same single-GPU pipeline as single_protein_simulation.py.
+Independent runs are the unit of parallelism: every worker process is bound to
+one GPU, and with more than one job per GPU the NVIDIA MPS daemon is started so
+small systems can share a GPU's SMs instead of time-slicing it.
+
+Usage:
+    python batch_simulation.py <protein.pdb> [<protein.pdb> ...] [options]
+
+Examples:
+    python batch_simulation.py pdbs/*.pdb
+    python batch_simulation.py pdbs/*.pdb --jobs-per-gpu 3 -t 50
+    python batch_simulation.py a.pdb b.pdb --gpus 0,2 -o results
+"""
+
+import argparse
+import dataclasses
+import multiprocessing
+import os
+import shutil
+import subprocess
+import sys
+from concurrent.futures import ProcessPoolExecutor, as_completed
+from pathlib import Path
+from typing import Optional
+
+from loguru import logger
+
+from single_protein_simulation import (
+    FORCEFIELD_MAP,
+    GPU_PRECISIONS,
+    WATER_MODEL_MAP,
+    SimulationConfig,
+    SimulationRunner,
+    detect_gpus,
+    unique_job_names,
+)
+
+# GPU assigned to the current worker process (set by _init_worker)
+_worker_gpu: Optional[str] = None
+
+
+def start_mps() -> bool:
+    """Start the NVIDIA MPS control daemon. Returns True if this call started it."""
+    if "CUDA_MPS_PIPE_DIRECTORY" in os.environ:
+        logger.info("Using existing MPS daemon (CUDA_MPS_PIPE_DIRECTORY is set)")
+        return False
+    if shutil.which("nvidia-cuda-mps-control") is None:
+        logger.warning("nvidia-cuda-mps-control not found; GPUs will be time-sliced")
+        return False
+
+    result = subprocess.run(
+        ["nvidia-cuda-mps-control", "-d"],
+        capture_output=True,
+        text=True,
+    )
+    if result.returncode != 0:
+        # Most commonly an MPS daemon is already running
+        logger.info(f"MPS daemon not started: {result.stderr.strip() or result.stdout.strip()}")
+        return False
+
+    logger.info("Started NVIDIA MPS daemon")
+    return True
+
+
+def stop_mps() -> None:
+    """Stop the NVIDIA MPS control daemon."""
+    subprocess.run(
+        ["nvidia-cuda-mps-control"],
+        input="quit\n",
+        capture_output=True,
+        text=True,
+    )
+    logger.info("Stopped NVIDIA MPS daemon")
+
+
+def _init_worker(gpu_slots: "multiprocessing.Queue[str]") -> None:
+    """Bind this worker process to one GPU for its whole lifetime."""
+    global _worker_gpu
+    _worker_gpu = gpu_slots.get()
+
+
+def run_job(config: SimulationConfig) -> str:
+    """Run the full pipeline for one config on this worker's GPU."""
+    if _worker_gpu is not None:
+        config = dataclasses.replace(config, gpu_device=_worker_gpu)
+    logger.info(f"[{config.job_name}] Starting on GPU {config.cuda_device_id}")
+    SimulationRunner(config).run_all()
+    return config.job_name
+
+
+def run_batch(
+    configs: list[SimulationConfig],
+    gpus: list[str],
+    jobs_per_gpu: int = 1,
+) -> list[str]:
+    """Run configs concurrently, jobs_per_gpu at a time on each GPU.
+
+    Returns the job names that failed.
+    """
+    n_workers = min(len(configs), len(gpus) * jobs_per_gpu)
+    mps_started = jobs_per_gpu > 1 and start_mps()
+
+    # One slot per worker: each GPU is handed out jobs_per_gpu times
+    gpu_slots: "multiprocessing.Queue[str]" = multiprocessing.Queue()
+    for _ in range(jobs_per_gpu):
+        for gpu in gpus:
+            gpu_slots.put(gpu)
+
+    failed = []
+    try:
+        with ProcessPoolExecutor(
+            max_workers=n_workers,
+            initializer=_init_worker,
+            initargs=(gpu_slots,),
+        ) as executor:
+            futures = {executor.submit(run_job, config): config for config in configs}
+            try:
+                for future in as_completed(futures):
+                    job_name = futures[future].job_name
+                    try:
+                        future.result()
+                        logger.success(f"[{job_name}] Completed")
+                    except Exception as e:
+                        logger.error(f"[{job_name}] Failed: {e}")
+                        failed.append(job_name)
+            except KeyboardInterrupt:
+                # The running jobs got the SIGINT too; drop the queued ones
+                # instead of letting the executor's exit wait for them
+                executor.shutdown(wait=False, cancel_futures=True)
+                raise
+    finally:
+        if mps_started:
+            stop_mps()
+
+    return failed
+
+
+def parse_args() -> argparse.Namespace:
+    """Parse command-line arguments."""
+    parser = argparse.ArgumentParser(
+        description="Run MD simulations for many proteins across GPUs with Amber",
+        formatter_class=argparse.RawDescriptionHelpFormatter,
+        epilog="""
+Examples:
+  %(prog)s pdbs/*.pdb
+  %(prog)s pdbs/*.pdb --jobs-per-gpu 3 -t 50
+  %(prog)s a.pdb b.pdb --gpus 0,2 -o results
+""",
+    )
+
+    parser.add_argument(
+        "pdb_files",
+        type=Path,
+        nargs="+",
+        help="Input PDB files (one simulation each)",
+    )
+    parser.add_argument(
+        "-t", "--time",
+        dest="sim_time_ns",
+        type=float,
+        default=10.0,
+        help="Production simulation time in ns (default: 10)",
+    )
+    parser.add_argument(
+        "-T", "--temp",
+        dest="temperature",
+        type=float,
+        default=300.0,
+        help="Temperature in Kelvin (default: 300)",
+    )
+    parser.add_argument(
+        "-b", "--box",
+        dest="box_buffer",
+        type=float,
+        default=12.0,
+        help="Box buffer size in Angstrom (default: 12)",
+    )
+    parser.add_argument(
+        "-f", "--forcefield",
+        default="ff19SB",
+        type=str.lower,
+        choices=list(FORCEFIELD_MAP),
+        help="Force field (default: ff19SB)",
+    )
+    parser.add_argument(
+        "-w", "--water",
+        dest="water_model",
+        default="opc",
+        type=str.lower,
+        choices=list(WATER_MODEL_MAP),
+        help="Water model (default: opc)",
+    )
+    parser.add_argument(
+        "--hmr",
+        action=argparse.BooleanOptionalAction,
+        default=True,
+        help="Hydrogen mass repartitioning with a 4 fs timestep (default: on)",
+    )
+    parser.add_argument(
+        "--gpus",
+        default="",
+        help="Comma-separated GPU indices to use (default: CUDA_VISIBLE_DEVICES, else all from nvidia-smi)",
+    )
+    parser.add_argument(
+        "--precision",
+        default="SPFP",
+        type=str.upper,
+        choices=GPU_PRECISIONS,
+        help="pmemd.cuda precision model (default: SPFP)",
+    )
+    parser.add_argument(
+        "-j", "--jobs-per-gpu",
+        type=int,
+        default=1,
+        help="Concurrent simulations per GPU; >1 starts NVIDIA MPS (default: 1)",
+    )
+    parser.add_argument(
+        "-o", "--outdir",
+        dest="output_dir",
+        type=Path,
+        default=Path("."),
+        help="Parent directory for the per-protein md_<name> directories (default: .)",
+    )
+
+    return parser.parse_args()
+
+
+def main() -> int:
+    """Main entry point."""
+    args = parse_args()
+
+    gpus = [g for g in args.gpus.split(",") if g] or detect_gpus()
+    if not gpus:
+        logger.error("No GPUs found (use --gpus to specify them explicitly)")
+        return 1
+    if args.jobs_per_gpu < 1:
+        logger.error("--jobs-per-gpu must be at least 1")
+        return 1
+
+    try:
+        configs = [
+            SimulationConfig(
+                pdb_file=pdb_file,
+                job_name=name,
+                sim_time_ns=args.sim_time_ns,
+                temperature=args.temperature,
+                box_buffer=args.box_buffer,
+                forcefield=args.forcefield,
+                water_model=args.water_model,
+                hmr=args.hmr,
+                precision=args.precision,
+                output_dir=args.output_dir / f"md_{name}",
+            )
+            for pdb_file, name in zip(args.pdb_files, unique_job_names(args.pdb_files))
+        ]
+    except (FileNotFoundError, ValueError) as e:
+        logger.error(str(e))
+        return 1
+
+    logger.info(
+        f"Running {len(configs)} simulations on GPUs {','.join(gpus)} "
+        f"({args.jobs_per_gpu} per GPU)"
+    )
+
+    try:
+        failed = run_batch(configs, gpus, args.jobs_per_gpu)
+    except KeyboardInterrupt:
+        logger.warning("Interrupted by user")
+        return 130
+
+    if failed:
+        logger.error(f"{len(failed)} of {len(configs)} simulations failed: {', '.join(failed)}")
+        return 1
+
+    logger.success(f"All {len(configs)} simulations completed")
+    return 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
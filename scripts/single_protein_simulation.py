@@ -20,13 +20,19 @@ Examples:
 """
 
 import argparse
+import hashlib
 import os
 import shutil
+import signal
 import subprocess
 import sys
+from collections import Counter
+from concurrent.futures import ThreadPoolExecutor
 from dataclasses import dataclass, field
+from functools import cached_property, lru_cache
 from pathlib import Path
-from typing import Optional
+from types import MappingProxyType
+from typing import Callable, Optional
 
 from loguru import logger
 
@@ -40,24 +46,254 @@ logger.add(
 )
 
 
-# Force field mappings
-FORCEFIELD_MAP = {
-    "ff14SB": "leaprc.protein.ff14SB",
+# Force field mappings (keys are lower-case; lookups are case-insensitive)
+FORCEFIELD_MAP = MappingProxyType({
     "ff14sb": "leaprc.protein.ff14SB",
-    "ff19SB": "leaprc.protein.ff19SB",
     "ff19sb": "leaprc.protein.ff19SB",
-}
+})
 
-# Water model mappings
-WATER_MODEL_MAP = {
+# Water model mappings (keys are lower-case; lookups are case-insensitive)
+WATER_MODEL_MAP = MappingProxyType({
     "tip3p": ("leaprc.water.tip3p", "TIP3PBOX"),
-    "TIP3P": ("leaprc.water.tip3p", "TIP3PBOX"),
     "opc": ("leaprc.water.opc", "OPCBOX"),
-    "OPC": ("leaprc.water.opc", "OPCBOX"),
     "tip4pew": ("leaprc.water.tip4pew", "TIP4PEWBOX"),
-    "TIP4PEW": ("leaprc.water.tip4pew", "TIP4PEWBOX"),
+})
+
+# MD engines in order of preference
+MD_ENGINES = ("pmemd.cuda", "pmemd", "sander")
+
+# pmemd.cuda precision models (pmemd.cuda_<model>); plain pmemd.cuda is SPFP
+GPU_PRECISIONS = ("SPFP", "DPFP", "SPXP")
+
+# Direct-space cutoff in Angstrom, and pmemd's default pair-list skin (skinnb);
+# the cutoff plus skin must fit in half of the shortest box side
+DEFAULT_CUTOFF = 10.0
+PAIRLIST_SKIN = 2.0
+
+# Fraction of the tleap box side assumed to survive NPT equilibration
+# (the box typically shrinks by a few percent as the density settles)
+NPT_BOX_MARGIN = 0.95
+
+# Box angles of rectangular and truncated octahedral periodic boxes
+BOX_ANGLES = (90.0, 109.4712206)
+
+# Engine environment defaults (values already set by the user win)
+ENGINE_ENV_DEFAULTS = {
+    "CUDA_CACHE_MAXSIZE": "2147483648",  # Keep JIT-compiled kernels across runs
+    "CUDA_CACHE_DISABLE": "0",
+    "CUDA_MODULE_LOADING": "LAZY",  # Load kernels on first use to shorten startup
+    "CUDA_DEVICE_ORDER": "PCI_BUS_ID",  # Match nvidia-smi device indices
+    "OMP_NUM_THREADS": "1",  # Avoid CPU oversubscription around the GPU driver thread
+    "MKL_NUM_THREADS": "1",
 }
 
+# Caller environment passed to Amber tools; variables set by amber.sh are
+# added on top, so the child environment stays small on crowded HPC nodes
+ENV_PASSTHROUGH = frozenset({
+    "PATH", "LD_LIBRARY_PATH", "HOME", "USER", "LOGNAME", "SHELL", "TERM",
+    "TMPDIR", "LANG", "PYTHONPATH", "PYTHONHOME", "PERL5LIB", "VIRTUAL_ENV",
+})
+ENV_PASSTHROUGH_PREFIXES = ("AMBER", "CUDA", "NVIDIA_", "LC_", "OMP_", "MKL_", "CONDA_", "SLURM_")
+
+# Shell bookkeeping variables printed by `env` that are not part of amber.sh
+SHELL_ENV_VARS = frozenset({"_", "SHLVL", "PWD", "OLDPWD"})
+
+# Residue names of the water and ions added by tleap (PDB columns 18-20)
+SOLVENT_RESIDUES = frozenset({b"WAT", b"HOH", b"Na+", b"Cl-"})
+
+
+@lru_cache(maxsize=32)
+def _which(name: str, path: str) -> Optional[str]:
+    """Locate an executable on the given PATH (cached per process)."""
+    return shutil.which(name, path=path)
+
+
+@lru_cache(maxsize=8)
+def _select_md_engine(path: str, use_gpu: bool, precision: str = "SPFP") -> Optional[str]:
+    """Return the preferred MD engine available on PATH, if any.
+
+    On GPUs the build for the requested precision model is preferred,
+    falling back to pmemd.cuda (SPFP).
+    """
+    for engine in (f"pmemd.cuda_{precision}",) + MD_ENGINES:
+        if engine.startswith("pmemd.cuda") and not use_gpu:
+            continue
+        if _which(engine, path) is not None:
+            return engine
+    return None
+
+
+@lru_cache(maxsize=None)
+def _gpu_numa_binding(device_id: str) -> Optional[tuple[str, int]]:
+    """Return (local_cpulist, numa_node) for a GPU's PCIe slot, if known."""
+    if shutil.which("nvidia-smi") is None:
+        return None
+    result = subprocess.run(
+        ["nvidia-smi", "-i", device_id, "--query-gpu=pci.bus_id", "--format=csv,noheader"],
+        capture_output=True,
+        text=True,
+    )
+    if result.returncode != 0:
+        return None
+
+    # nvidia-smi reports an 8-digit PCI domain ("00000000:3B:00.0"); sysfs uses 4
+    bus_id = result.stdout.strip().lower()[-12:]
+    device_dir = Path("/sys/bus/pci/devices") / bus_id
+    try:
+        cpulist = (device_dir / "local_cpulist").read_text().strip()
+        numa_node = int((device_dir / "numa_node").read_text())
+    except (OSError, ValueError):
+        return None
+    return cpulist, numa_node
+
+
+def _parse_cpulist(cpulist: str) -> set[int]:
+    """Expand a sysfs CPU list ("0-3,8,10-11") into CPU numbers."""
+    cpus: set[int] = set()
+    for part in cpulist.split(","):
+        if not part:
+            continue
+        first, _, last = part.partition("-")
+        cpus.update(range(int(first), int(last or first) + 1))
+    return cpus
+
+
+def _read_tail(path: Path, size: int = 8192) -> str:
+    """Return the last size bytes of a (possibly very large) log file."""
+    with open(path, "rb") as f:
+        f.seek(0, os.SEEK_END)
+        f.seek(max(0, f.tell() - size))
+        return f.read().decode(errors="replace")
+
+
+def _parse_inpcrd_box(inpcrd_file: Path) -> Optional[tuple[float, float, float]]:
+    """Read the box lengths (A) from the last line of an Amber inpcrd file.
+
+    Returns None unless that line looks like a periodic box line, so the
+    last coordinate line of a non-periodic file is not mistaken for one.
+    """
+    try:
+        line = _read_tail(inpcrd_file, 256).rstrip().rsplit("\n", 1)[-1]
+        # Box line is 6F12.7: a, b, c, alpha, beta, gamma
+        values = [float(line[i:i + 12]) for i in range(0, 72, 12)]
+    except (OSError, ValueError):
+        return None
+    lengths, angles = values[:3], values[3:]
+    if min(lengths) <= 0:
+        return None
+    if not all(any(abs(angle - ref) < 0.5 for ref in BOX_ANGLES) for angle in angles):
+        return None
+    return tuple(lengths)
+
+
+@lru_cache(maxsize=1)
+def _amber_env_delta(amber_sh: Path, mtime: float) -> dict[str, str]:
+    """Return the variables amber.sh sets or changes.
+
+    amber.sh is sourced in the whitelisted environment the tools run in,
+    so a variable it exports is kept even if the caller already has it
+    (e.g. from sourcing amber.sh in .bashrc). Sourced once per process;
+    mtime is part of the cache key so that edits to amber.sh are picked up.
+    """
+    base_env = _passthrough_env()
+    # --norc: bash may otherwise read ~/.bashrc (e.g. when stdin is a
+    # socket) and export the user's shell setup along with amber.sh
+    result = subprocess.run(
+        ["/bin/bash", "--norc", "--noprofile", "-c", f"source {amber_sh} && env"],
+        stdin=subprocess.DEVNULL,
+        capture_output=True,
+        text=True,
+        env=base_env,
+    )
+    if result.returncode != 0:
+        raise RuntimeError(f"Failed to source amber.sh: {result.stderr}")
+
+    delta = {}
+    for line in result.stdout.splitlines():
+        if "=" in line:
+            key, _, value = line.partition("=")
+            if key not in SHELL_ENV_VARS and base_env.get(key) != value:
+                delta[key] = value
+    return delta
+
+
+def _passthrough_env() -> dict[str, str]:
+    """Return the caller's environment variables that Amber tools need."""
+    return {
+        key: value
+        for key, value in os.environ.items()
+        if key in ENV_PASSTHROUGH or key.startswith(ENV_PASSTHROUGH_PREFIXES)
+    }
+
+
+def _count_solute_atoms(pdb_file: Path) -> int:
+    """Count the atoms before the first water or ion residue in a tleap PDB."""
+    count = 0
+    with open(pdb_file, "rb") as f:
+        for line in f:
+            if line.startswith((b"ATOM  ", b"HETATM")):
+                if line[17:20] in SOLVENT_RESIDUES:
+                    break
+                count += 1
+    return count
+
+
+def _read_prmtop_natom(prmtop_file: Path) -> int:
+    """Read the atom count (NATOM) from the POINTERS section of a prmtop file.
+
+    POINTERS is the second section of the file, so only its header is read.
+    Returns 0 if the section is not found.
+    """
+    with open(prmtop_file, "rb") as f:
+        lines = f.read(8192).splitlines()
+    for i, line in enumerate(lines[:-2]):
+        if line.startswith(b"%FLAG POINTERS"):
+            # Skip the %FORMAT(10I8) line; NATOM is the first value
+            return int(lines[i + 2][:8])
+    return 0
+
+
+def detect_gpus() -> list[str]:
+    """Return the GPUs this process may use.
+
+    An inherited CUDA_VISIBLE_DEVICES (e.g. from a scheduler) wins;
+    otherwise every GPU listed by nvidia-smi is returned.
+    """
+    visible = os.environ.get("CUDA_VISIBLE_DEVICES")
+    if visible is not None:
+        return [gpu.strip() for gpu in visible.split(",") if gpu.strip()]
+    if shutil.which("nvidia-smi") is None:
+        return []
+    result = subprocess.run(
+        ["nvidia-smi", "--query-gpu=index", "--format=csv,noheader"],
+        capture_output=True,
+        text=True,
+    )
+    if result.returncode != 0:
+        return []
+    return [line.strip() for line in result.stdout.splitlines() if line.strip()]
+
+
+def unique_job_names(pdb_files: list[Path]) -> list[str]:
+    """Return one job name per PDB file, unique within the batch.
+
+    Names are the file stems; repeated stems (e.g. a/protein.pdb and
+    b/protein.pdb) get their parent directory prepended, then a counter,
+    so no two jobs share an md_<name> output directory.
+    """
+    stem_counts = Counter(path.stem for path in pdb_files)
+    names: list[str] = []
+    for path in pdb_files:
+        name = path.stem
+        if stem_counts[name] > 1:
+            name = f"{Path(os.path.abspath(path)).parent.name}_{name}"
+        base, n = name, 2
+        while name in names:
+            name = f"{base}_{n}"
+            n += 1
+        names.append(name)
+    return names
+
 
 @dataclass
 class SimulationConfig:
@@ -72,6 +308,13 @@ class SimulationConfig:
     forcefield: str = "ff19SB"
     water_model: str = "opc"
     use_gpu: bool = True
+    gpu_device: Optional[str] = None  # e.g. "cuda:0" or "1"; None keeps CUDA_VISIBLE_DEVICES
+    hmr: bool = True  # Hydrogen mass repartitioning + 4 fs timestep
+    equil_trajectory: bool = False  # Write equil.nc snapshots (every 5 ps)
+    run_tleap_check: bool = True  # Run tleap "check" on the unsolvated protein
+    stage_cache: bool = True  # Reuse outputs of unchanged stages from output_dir/.cache
+    solute_trajectory: bool = False  # Write only solute atoms to prod.nc (ntwprt)
+    precision: str = "SPFP"  # pmemd.cuda precision model (SPFP, DPFP or SPXP)
     dry_run: bool = False
     output_dir: Path = field(default_factory=Path)
 
@@ -79,6 +322,7 @@ class SimulationConfig:
     ff_source: str = field(init=False, default="")
     water_source: str = field(init=False, default="")
     water_box: str = field(init=False, default="")
+    cuda_device_id: Optional[str] = field(init=False, default=None)
 
     def __post_init__(self) -> None:
         """Validate inputs and set derived fields."""
@@ -88,12 +332,12 @@ class SimulationConfig:
         if isinstance(self.output_dir, str):
             self.output_dir = Path(self.output_dir)
 
-        # Validate PDB file exists
-        if not self.pdb_file.exists():
-            raise FileNotFoundError(f"PDB file not found: {self.pdb_file}")
-
-        # Get absolute path
-        self.pdb_file = self.pdb_file.resolve()
+        # Validate PDB file exists and get its absolute path (one stat)
+        try:
+            os.stat(self.pdb_file)
+        except FileNotFoundError:
+            raise FileNotFoundError(f"PDB file not found: {self.pdb_file}") from None
+        self.pdb_file = Path(os.path.realpath(self.pdb_file))
 
         # Set job name from PDB filename if not specified
         if not self.job_name:
@@ -104,20 +348,29 @@ class SimulationConfig:
             self.output_dir = Path(f"./md_{self.job_name}")
 
         # Validate and map force field
-        if self.forcefield not in FORCEFIELD_MAP:
+        ff_key = self.forcefield.lower()
+        if ff_key not in FORCEFIELD_MAP:
             raise ValueError(
                 f"Unknown force field: {self.forcefield} "
-                f"(supported: {', '.join(set(FORCEFIELD_MAP.keys()))})"
+                f"(supported: {', '.join(FORCEFIELD_MAP)})"
             )
-        self.ff_source = FORCEFIELD_MAP[self.forcefield]
+        self.ff_source = FORCEFIELD_MAP[ff_key]
 
         # Validate and map water model
-        if self.water_model not in WATER_MODEL_MAP:
+        water_key = self.water_model.lower()
+        if water_key not in WATER_MODEL_MAP:
             raise ValueError(
                 f"Unknown water model: {self.water_model} "
-                f"(supported: {', '.join(set(WATER_MODEL_MAP.keys()))})"
+                f"(supported: {', '.join(WATER_MODEL_MAP)})"
+            )
+        self.water_source, self.water_box = WATER_MODEL_MAP[water_key]
+
+        self.precision = self.precision.upper()
+        if self.precision not in GPU_PRECISIONS:
+            raise ValueError(
+                f"Unknown GPU precision model: {self.precision} "
+                f"(supported: {', '.join(GPU_PRECISIONS)})"
             )
-        self.water_source, self.water_box = WATER_MODEL_MAP[self.water_model]
 
         # Validate numeric parameters
         if self.sim_time_ns <= 0:
@@ -129,27 +382,31 @@ class SimulationConfig:
         if self.salt_conc < 0:
             raise ValueError("Salt concentration cannot be negative")
 
+        # Parse GPU device string (e.g., "cuda:0" -> "0", "1" -> "1")
+        if self.gpu_device is None:
+            self.cuda_device_id = None
+        elif self.gpu_device.lower().startswith("cuda:"):
+            self.cuda_device_id = self.gpu_device.split(":")[-1]
+        else:
+            self.cuda_device_id = self.gpu_device
 
-class InputFileGenerator:
-    """Generate Amber input files for MD simulations."""
 
-    def __init__(self, config: SimulationConfig) -> None:
-        self.config = config
+# Input file templates, built once at import and filled per simulation
+# Runs before solvatebox so only the protein, not the solvent, is checked
+TLEAP_CHECK_BLOCK = """# Check for problems
+check mol
 
-    def generate_tleap_input(self) -> str:
-        """Generate tleap.in for system preparation."""
-        return f"""# Load force field
-source {self.config.ff_source}
-source {self.config.water_source}
+"""
 
-# Load protein
-mol = loadpdb {self.config.pdb_file}
+TLEAP_TEMPLATE = """# Load force field
+source {ff_source}
+source {water_source}
 
-# Check for problems
-check mol
+# Load protein
+mol = loadpdb {pdb_file}
 
-# Solvate with water box
-solvatebox mol {self.config.water_box} {self.config.box_buffer}
+{check_block}# Solvate with water box
+solvatebox mol {water_box} {box_buffer}
 
 # Add ions to neutralize the system
 # addIons2 handles both positive and negative systems automatically
@@ -165,10 +422,12 @@ savepdb mol system.pdb
 quit
 """
 
-    def generate_minimization_input(self, with_restraints: bool = True) -> str:
-        """Generate minimization input file."""
-        if with_restraints:
-            return """Minimization
+HMR_INPUT = """HMassRepartition
+outparm system.prmtop
+quit
+"""
+
+MIN_TEMPLATE = """Minimization
  &cntrl
    imin=1,           ! Minimization
    maxcyc=5000,      ! Max cycles
@@ -177,33 +436,30 @@ quit
    ntr=1,            ! Restrain heavy atoms
    restraint_wt=10.0,
    restraintmask='!@H=',
-   cut=10.0,
+   cut={cut},
    ntpr=100,
  /
 """
-        else:
-            return """Minimization (no restraints)
+
+MIN2_TEMPLATE = """Minimization (no restraints)
  &cntrl
    imin=1,
    maxcyc=5000,
    ncyc=2500,
    ntb=1,
    ntr=0,
-   cut=10.0,
+   cut={cut},
    ntpr=100,
  /
 """
 
-    def generate_heating_input(self) -> str:
-        """Generate heating input file (NVT)."""
-        nsteps_heat = 25000  # 50 ps heating
-        return f"""Heating from 0 to {self.config.temperature} K
+HEAT_TEMPLATE = """Heating from 0 to {temperature} K
  &cntrl
    imin=0,           ! MD
    irest=0,          ! New simulation
    ntx=1,            ! Read coordinates only
    ntb=1,            ! Constant volume PBC
-   cut=10.0,
+   cut={cut},
    ntr=1,            ! Restrain protein
    restraint_wt=5.0,
    restraintmask='@CA',
@@ -212,24 +468,21 @@ quit
    ntc=2,            ! SHAKE on hydrogens
    ntf=2,            ! No force calc on H bonds
    tempi=0.0,
-   temp0={self.config.temperature},
+   temp0={temperature},
    ntt=3,            ! Langevin thermostat
    gamma_ln=2.0,
    ig=-1,            ! Random seed
    ntpr=500,
-   ntwx=500,
+   ntwx=0,           ! No trajectory (heating frames are not analyzed)
    ntwr=5000,
    iwrap=1,
    nmropt=1,         ! NMR restraints for temperature ramp
  /
- &wt type='TEMP0', istep1=0, istep2={nsteps_heat}, value1=0.0, value2={self.config.temperature}, /
+ &wt type='TEMP0', istep1=0, istep2={nsteps_heat}, value1=0.0, value2={temperature}, /
  &wt type='END' /
 """
 
-    def generate_equilibration_input(self) -> str:
-        """Generate equilibration input file (NPT)."""
-        nsteps_equil = 250000  # 500 ps equilibration
-        return f"""Equilibration (NPT)
+EQUIL_TEMPLATE = """Equilibration (NPT)
  &cntrl
    imin=0,
    irest=1,          ! Restart
@@ -238,30 +491,26 @@ quit
    pres0=1.0,        ! 1 atm
    ntp=1,            ! Isotropic pressure scaling
    taup=2.0,         ! Pressure relaxation time
-   cut=10.0,
+   cut={cut},
    ntr=1,            ! Restrain CA atoms
    restraint_wt=2.0,
    restraintmask='@CA',
-   nstlim={nsteps_equil},
-   dt=0.002,
+   nstlim={nstlim},
+   dt={dt},
    ntc=2,
    ntf=2,
-   temp0={self.config.temperature},
+   temp0={temperature},
    ntt=3,
    gamma_ln=2.0,
    ig=-1,
-   ntpr=500,
-   ntwx=500,
-   ntwr=10000,
+   ntpr={ntpr},         ! Energy output every 1 ps
+   ntwx={ntwx},
+   ntwr={ntwr},        ! Restart every 20 ps
    iwrap=1,
  /
 """
 
-    def generate_production_input(self) -> str:
-        """Generate production MD input file (NPT)."""
-        # Calculate steps (2 fs timestep): ns * 1e6 fs / 2 fs = ns * 500000
-        nsteps_prod = int(self.config.sim_time_ns * 500000)
-        return f"""Production MD (NPT)
+PROD_TEMPLATE = """Production MD (NPT)
  &cntrl
    imin=0,
    irest=1,
@@ -270,39 +519,129 @@ quit
    pres0=1.0,
    ntp=1,
    taup=2.0,
-   cut=10.0,
+   cut={cut},
    ntr=0,            ! No restraints
-   nstlim={nsteps_prod},
-   dt=0.002,
+   nstlim={nstlim},
+   dt={dt},
    ntc=2,
    ntf=2,
-   temp0={self.config.temperature},
+   temp0={temperature},
    ntt=3,
    gamma_ln=2.0,
    ig=-1,
-   ntpr=5000,        ! Energy output every 10 ps
-   ntwx=5000,        ! Trajectory every 10 ps
-   ntwr=50000,       ! Restart every 100 ps
+   ntpr={ntpr},        ! Energy output every 10 ps
+   ntwx={ntwx},        ! Trajectory every 10 ps
+{ntwprt}   ntwr={ntwr},       ! Restart every 100 ps
    iwrap=1,
    ioutfm=1,         ! NetCDF trajectory format
  /
 """
 
+# Inputs that are fixed at the default cutoff, encoded once
+HMR_INPUT_BYTES = HMR_INPUT.encode()
+MIN_INPUT_BYTES = MIN_TEMPLATE.format(cut=DEFAULT_CUTOFF).encode()
+MIN2_INPUT_BYTES = MIN2_TEMPLATE.format(cut=DEFAULT_CUTOFF).encode()
+
+
+class InputFileGenerator:
+    """Generate Amber input files for MD simulations."""
+
+    def __init__(self, config: SimulationConfig, cut: float = DEFAULT_CUTOFF) -> None:
+        self.config = config
+        self.cut = cut
+        self.n_solute: Optional[int] = None  # Atoms written to prod.nc (all if None)
+
+    def timestep(self) -> float:
+        """Equilibration/production timestep in ps (4 fs with HMR, else 2 fs)."""
+        return 0.004 if self.config.hmr else 0.002
+
+    def steps_per_ns(self) -> int:
+        """Number of MD steps per ns at the equilibration/production timestep."""
+        return 250000 if self.config.hmr else 500000
+
+    def generate_tleap_input(self) -> str:
+        """Generate tleap.in for system preparation."""
+        return TLEAP_TEMPLATE.format(
+            ff_source=self.config.ff_source,
+            water_source=self.config.water_source,
+            pdb_file=self.config.pdb_file,
+            check_block=TLEAP_CHECK_BLOCK if self.config.run_tleap_check else "",
+            water_box=self.config.water_box,
+            box_buffer=self.config.box_buffer,
+        )
+
+    def generate_hmr_input(self) -> str:
+        """Generate ParmEd input for hydrogen mass repartitioning."""
+        # Moves mass from heavy atoms onto bonded hydrogens (H -> 3.024 Da)
+        return HMR_INPUT
+
+    def generate_minimization_input(self, with_restraints: bool = True) -> str:
+        """Generate minimization input file."""
+        template = MIN_TEMPLATE if with_restraints else MIN2_TEMPLATE
+        return template.format(cut=self.cut)
+
+    def generate_heating_input(self) -> str:
+        """Generate heating input file (NVT)."""
+        return HEAT_TEMPLATE.format(
+            nsteps_heat=25000,  # 50 ps heating
+            temperature=self.config.temperature,
+            cut=self.cut,
+        )
+
+    def generate_equilibration_input(self) -> str:
+        """Generate equilibration input file (NPT)."""
+        steps_per_ns = self.steps_per_ns()
+        # Equilibration frames are rarely analyzed; write them only on request
+        ntwx_equil = steps_per_ns // 200 if self.config.equil_trajectory else 0
+        return EQUIL_TEMPLATE.format(
+            nstlim=steps_per_ns // 2,  # 500 ps equilibration
+            dt=self.timestep(),
+            cut=self.cut,
+            temperature=self.config.temperature,
+            ntpr=steps_per_ns // 1000,
+            ntwx=ntwx_equil,
+            ntwr=steps_per_ns // 50,
+        )
+
+    def generate_production_input(self) -> str:
+        """Generate production MD input file (NPT)."""
+        # Calculate steps: ns * 1e6 fs / 4 fs (HMR) or 2 fs
+        steps_per_ns = self.steps_per_ns()
+        return PROD_TEMPLATE.format(
+            nstlim=int(self.config.sim_time_ns * steps_per_ns),
+            dt=self.timestep(),
+            cut=self.cut,
+            temperature=self.config.temperature,
+            ntpr=steps_per_ns // 100,
+            ntwx=steps_per_ns // 100,
+            ntwr=steps_per_ns // 10,
+            ntwprt=f"   ntwprt={self.n_solute},\n" if self.n_solute else "",
+        )
+
     def write_all_input_files(self, output_dir: Path) -> None:
         """Write all input files to the output directory."""
         files = {
-            "tleap.in": self.generate_tleap_input(),
-            "min.in": self.generate_minimization_input(with_restraints=True),
-            "min2.in": self.generate_minimization_input(with_restraints=False),
-            "heat.in": self.generate_heating_input(),
-            "equil.in": self.generate_equilibration_input(),
-            "prod.in": self.generate_production_input(),
+            "tleap.in": self.generate_tleap_input().encode(),
+            "min.in": MIN_INPUT_BYTES,
+            "min2.in": MIN2_INPUT_BYTES,
+            "heat.in": self.generate_heating_input().encode(),
+            "equil.in": self.generate_equilibration_input().encode(),
+            "prod.in": self.generate_production_input().encode(),
         }
-
-        for filename, content in files.items():
-            filepath = output_dir / filename
-            filepath.write_text(content)
-            logger.debug(f"Created {filepath}")
+        if self.cut != DEFAULT_CUTOFF:
+            files["min.in"] = self.generate_minimization_input(with_restraints=True).encode()
+            files["min2.in"] = self.generate_minimization_input(with_restraints=False).encode()
+        if self.config.hmr:
+            files["hmr.in"] = HMR_INPUT_BYTES
+
+        # Overlap per-file metadata latency on network filesystems
+        with ThreadPoolExecutor(max_workers=len(files)) as executor:
+            list(executor.map(
+                lambda item: (output_dir / item[0]).write_bytes(item[1]),
+                files.items(),
+            ))
+        for filename in files:
+            logger.debug(f"Created {output_dir / filename}")
 
         logger.success("Input files created")
 
@@ -312,12 +651,17 @@ class SimulationRunner:
 
     def __init__(self, config: SimulationConfig) -> None:
         self.config = config
-        self.md_engine: Optional[str] = None
         self.amber_env: Optional[Path] = None
-        self.env: dict = os.environ.copy()
+        self.env: dict = _passthrough_env()
+        self.launch_prefix: list[str] = []  # numactl binding for the MD engine
+        self.engine_args: list[str] = []  # Extra MD engine flags (e.g. -AllowSmallBox)
 
     def setup_environment(self) -> None:
-        """Set up Amber environment variables."""
+        """Set up Amber environment variables and detect the MD engine.
+
+        The engine is detected here so a missing engine fails before any
+        stage runs.
+        """
         # Find amber.sh relative to script location
         script_dir = Path(__file__).parent.parent
         amber_env_dir = script_dir / "env"
@@ -329,87 +673,139 @@ class SimulationRunner:
             )
 
         self.amber_env = amber_env_dir
+        amber_sh = amber_env_dir / "amber.sh"
+
+        self.env.update(_amber_env_delta(amber_sh, amber_sh.stat().st_mtime))
+        for key, value in ENGINE_ENV_DEFAULTS.items():
+            self.env.setdefault(key, value)
+
+        # Pin the run to a single GPU; independent runs are the unit of
+        # parallelism, not multi-GPU jobs. Without an explicit device the
+        # caller's (e.g. the scheduler's) CUDA_VISIBLE_DEVICES is kept.
+        if self.config.use_gpu and self.config.cuda_device_id is not None:
+            self.env["CUDA_VISIBLE_DEVICES"] = self.config.cuda_device_id
+            logger.info(f"GPU device set: CUDA_VISIBLE_DEVICES={self.config.cuda_device_id}")
+            self.bind_to_gpu_numa_node()
+        elif self.config.use_gpu:
+            visible = self.env.get("CUDA_VISIBLE_DEVICES", "<unset>")
+            logger.info(f"Using inherited CUDA_VISIBLE_DEVICES={visible}")
 
-        # Source amber.sh and capture environment
-        cmd = f"source {amber_env_dir}/amber.sh && env"
-        result = subprocess.run(
-            cmd,
-            shell=True,
-            capture_output=True,
-            text=True,
-            executable="/bin/bash",
-        )
-
-        if result.returncode != 0:
-            raise RuntimeError(f"Failed to source amber.sh: {result.stderr}")
+        logger.info("Amber environment configured")
+        _ = self.md_engine  # Cached; fail now rather than after tleap
+
+    def bind_to_gpu_numa_node(self) -> None:
+        """Run the MD engine on the CPUs and memory local to the selected GPU.
+
+        pmemd.cuda drives the GPU from a single CPU thread; on multi-socket
+        hosts, letting it migrate across NUMA nodes slows kernel launches.
+        The GPU-local CPUs this process may use are all kept (not one core)
+        so concurrent jobs on the same GPU do not compete for a single CPU.
+        Only the MD engine is bound; tleap and ParmEd run unbound.
+        """
+        if _which("numactl", self.env.get("PATH", "")) is None:
+            logger.debug("numactl not found; not binding to the GPU's NUMA node")
+            return
 
-        # Parse environment variables
-        for line in result.stdout.splitlines():
-            if "=" in line:
-                key, _, value = line.partition("=")
-                self.env[key] = value
+        binding = _gpu_numa_binding(self.config.cuda_device_id)
+        if binding is None:
+            logger.debug("GPU NUMA locality unknown; not binding")
+            return
 
-        logger.info("Amber environment configured")
+        local_cpulist, numa_node = binding
+        try:
+            cpus = _parse_cpulist(local_cpulist)
+        except ValueError:
+            logger.debug(f"Cannot parse GPU local_cpulist {local_cpulist!r}; not binding")
+            return
+        if hasattr(os, "sched_getaffinity"):
+            # numactl rejects CPUs outside a restricted cpuset (SLURM, docker
+            # --cpuset-cpus, cgroup v2), so stay within the allowed ones
+            cpus &= os.sched_getaffinity(0)
+        if not cpus:
+            logger.debug("No GPU-local CPUs are available to this process; not binding")
+            return
 
-    def detect_md_engine(self) -> str:
-        """Detect the best available MD engine."""
-        if self.config.use_gpu:
-            # Check for pmemd.cuda
-            result = subprocess.run(
-                ["which", "pmemd.cuda"],
-                capture_output=True,
-                env=self.env,
+        cpulist = ",".join(str(cpu) for cpu in sorted(cpus))
+        self.launch_prefix = ["numactl", f"--physcpubind={cpulist}"]
+        if numa_node >= 0:
+            self.launch_prefix.append(f"--preferred={numa_node}")
+        self.launch_prefix.append("--")
+        logger.info(f"Binding to GPU-local CPUs {cpulist} (NUMA node {numa_node})")
+
+    @cached_property
+    def md_engine(self) -> str:
+        """The best available MD engine, detected on first use."""
+        path = self.env.get("PATH", "")
+        amberhome = self.env.get("AMBERHOME")
+        if amberhome:
+            # amber.sh puts $AMBERHOME/bin on PATH; look there before walking
+            # the rest of PATH (which may include slow network mounts)
+            path = os.pathsep.join((os.path.join(amberhome, "bin"), path))
+        engine = _select_md_engine(path, self.config.use_gpu, self.config.precision)
+        if engine is None:
+            raise RuntimeError("No Amber MD engine found (pmemd.cuda, pmemd, or sander)")
+
+        if engine.startswith("pmemd.cuda"):
+            logger.info(f"Using GPU-accelerated {engine}")
+            if engine == "pmemd.cuda" and self.config.precision != "SPFP":
+                logger.warning(
+                    f"pmemd.cuda_{self.config.precision} not found; "
+                    "pmemd.cuda runs in SPFP precision"
+                )
+            logger.info(
+                "pmemd.cuda.MPI is not used: Amber does not scale a single "
+                "run across GPUs; run independent jobs per GPU instead"
             )
-            if result.returncode == 0:
-                self.md_engine = "pmemd.cuda"
-                logger.info("Using GPU-accelerated pmemd.cuda")
-                return self.md_engine
-
-        # Check for pmemd
-        result = subprocess.run(
-            ["which", "pmemd"],
-            capture_output=True,
-            env=self.env,
-        )
-        if result.returncode == 0:
-            self.md_engine = "pmemd"
+        elif engine == "pmemd":
             logger.info("Using CPU pmemd")
-            return self.md_engine
-
-        # Fall back to sander
-        result = subprocess.run(
-            ["which", "sander"],
-            capture_output=True,
-            env=self.env,
-        )
-        if result.returncode == 0:
-            self.md_engine = "sander"
+        else:
             logger.warning("Using sander (slower than pmemd)")
-            return self.md_engine
-
-        raise RuntimeError("No Amber MD engine found (pmemd.cuda, pmemd, or sander)")
+        return engine
 
     def run_command(
         self,
         cmd: list[str],
         step_name: str,
         check_output: Optional[Path] = None,
+        log_name: Optional[str] = None,
+        stdin_text: Optional[str] = None,
     ) -> None:
-        """Run a command and check for success."""
-        logger.info(f"Running {step_name}...")
-
-        result = subprocess.run(
-            cmd,
-            env=self.env,
-            cwd=self.config.output_dir,
-            capture_output=True,
-            text=True,
-        )
-
-        if result.returncode != 0:
+        """Run a command, streaming its stdout/stderr to log files.
+
+        If stdin_text is given it is fed to the command on stdin; otherwise
+        stdin is closed so the child never reads the caller's stdin.
+        """
+        log_name = log_name or step_name.split()[0].lower()
+        stdout_log = self.config.output_dir / f"{log_name}.stdout.log"
+        stderr_log = self.config.output_dir / f"{log_name}.stderr.log"
+
+        # MD engines report progress in their -o file, other tools on stdout
+        progress = cmd[cmd.index("-o") + 1] if "-o" in cmd else stdout_log.name
+        logger.info(f"Running {step_name}... (progress: {self.config.output_dir / progress})")
+
+        with open(stdout_log, "wb") as out, open(stderr_log, "wb") as err:
+            # Run in its own session so an interrupt can stop the whole job
+            proc = subprocess.Popen(
+                cmd,
+                env=self.env,
+                cwd=self.config.output_dir,
+                stdin=subprocess.DEVNULL if stdin_text is None else subprocess.PIPE,
+                stdout=out,
+                stderr=err,
+                start_new_session=True,
+            )
+            try:
+                proc.communicate(None if stdin_text is None else stdin_text.encode())
+                returncode = proc.returncode
+            except KeyboardInterrupt:
+                os.killpg(proc.pid, signal.SIGTERM)
+                proc.wait()
+                raise
+
+        if returncode != 0:
             logger.error(f"{step_name} failed!")
             logger.error(f"Command: {' '.join(cmd)}")
-            logger.error(f"Stderr: {result.stderr}")
+            logger.error(f"Stderr tail:\n{_read_tail(stderr_log)}")
             raise RuntimeError(f"{step_name} failed. Check output files for details.")
 
         if check_output and not check_output.exists():
@@ -419,29 +815,109 @@ class SimulationRunner:
 
         logger.success(f"{step_name} completed")
 
+    def _stage_key(self, input_files: list[Path], in_text: str = "") -> str:
+        """Hash a stage's input files and parameters into a cache key."""
+        digest = hashlib.blake2b(digest_size=16)
+        for path in input_files:
+            with open(path, "rb") as f:
+                digest.update(hashlib.file_digest(f, "blake2b").digest())
+        digest.update(in_text.encode())
+        return digest.hexdigest()
+
+    def _run_cached(
+        self,
+        stage: str,
+        inputs: list[str],
+        outputs: list[str],
+        run: Callable[[], None],
+        in_text: str = "",
+    ) -> None:
+        """Run a stage, or restore its outputs if its inputs are unchanged.
+
+        Outputs are stored in output_dir/.cache under a hash of the input
+        files (relative to output_dir) and in_text (the tleap script, or
+        the MD engine for MD stages).
+        """
+        if not self.config.stage_cache:
+            run()
+            return
+
+        out_dir = self.config.output_dir
+        cache_dir = out_dir / ".cache"
+        key = self._stage_key(
+            [out_dir / name for name in inputs],
+            in_text,
+        )
+        cached = [cache_dir / f"{stage}.{key}.{name}" for name in outputs]
+
+        if all(path.exists() for path in cached):
+            for path, name in zip(cached, outputs):
+                shutil.copyfile(path, out_dir / name)
+            logger.info(f"Cached {stage}, skipping")
+            return
+
+        run()
+        cache_dir.mkdir(exist_ok=True)
+        # Keep only the newest entry per stage so .cache does not keep growing
+        current = f"{stage}.{key}."
+        for old in cache_dir.glob(f"{stage}.*"):
+            if not old.name.startswith(current):
+                old.unlink(missing_ok=True)
+        for path, name in zip(cached, outputs):
+            # Missing outputs are reported by the stage's own checks
+            if (out_dir / name).exists():
+                shutil.copyfile(out_dir / name, path)
+
     def run_tleap(self) -> None:
         """Run tleap to prepare the system."""
-        cmd = ["tleap", "-f", "tleap.in"]
-        self.run_command(cmd, "tleap")
+        # tleap reads its script sequentially, so it is piped in directly;
+        # tleap.in is still written as a record of the run
+        tleap_input = InputFileGenerator(self.config).generate_tleap_input()
+        if os.name == "nt":
+            # No /dev/stdin on Windows: read the tleap.in written with the inputs
+            cmd, stdin_text = ["tleap", "-f", "tleap.in"], None
+        else:
+            cmd, stdin_text = ["tleap", "-f", "/dev/stdin"], tleap_input
+        self._run_cached(
+            "tleap",
+            [str(self.config.pdb_file)],
+            ["system.prmtop", "system.inpcrd", "system.pdb"],
+            lambda: self.run_command(
+                cmd,
+                "tleap",
+                log_name="tleap",
+                stdin_text=stdin_text,
+            ),
+            in_text=tleap_input,
+        )
 
         # Verify outputs
         prmtop = self.config.output_dir / "system.prmtop"
         inpcrd = self.config.output_dir / "system.inpcrd"
 
         if not prmtop.exists() or not inpcrd.exists():
-            log_file = self.config.output_dir / "tleap.log"
+            log_file = self.config.output_dir / "tleap.stdout.log"
             if log_file.exists():
-                logger.error(f"tleap log:\n{log_file.read_text()}")
-            raise RuntimeError("tleap failed. Check tleap.log for details.")
-
-        # Count atoms in system
-        system_pdb = self.config.output_dir / "system.pdb"
-        if system_pdb.exists():
-            natoms = sum(
-                1 for line in system_pdb.read_text().splitlines()
-                if line.startswith("ATOM")
-            )
-            logger.success(f"System prepared: {natoms} atoms")
+                logger.error(f"tleap log tail:\n{_read_tail(log_file)}")
+            raise RuntimeError(f"tleap failed. Check {log_file.name} for details.")
+
+        natoms = _read_prmtop_natom(prmtop)
+        logger.success(f"System prepared: {natoms} atoms")
+
+    def run_hmr(self) -> None:
+        """Repartition hydrogen masses in system.prmtop with ParmEd."""
+        cmd = ["parmed", "-O", "-p", "system.prmtop", "-i", "hmr.in"]
+        self._run_cached(
+            "hmr",
+            ["system.prmtop", "hmr.in"],
+            ["system.prmtop"],
+            lambda: self.run_command(
+                cmd,
+                "Hydrogen mass repartitioning",
+                check_output=self.config.output_dir / "system.prmtop",
+                log_name="hmr",
+            ),
+        )
 
     def run_minimization(self, stage: int = 1) -> None:
         """Run energy minimization."""
@@ -461,8 +937,10 @@ class SimulationRunner:
             step_name = "Minimization (no restraints)"
 
         cmd = [
+            *self.launch_prefix,
             self.md_engine,
             "-O",
+            *self.engine_args,
             "-i", input_file,
             "-o", f"{output_file}.out",
             "-p", "system.prmtop",
@@ -470,17 +948,26 @@ class SimulationRunner:
             "-r", restart,
         ] + extra_args
 
-        self.run_command(
-            cmd,
-            step_name,
-            check_output=self.config.output_dir / restart,
+        self._run_cached(
+            output_file,
+            [input_file, "system.prmtop", coords],
+            [restart, f"{output_file}.out"],
+            lambda: self.run_command(
+                cmd,
+                step_name,
+                check_output=self.config.output_dir / restart,
+                log_name=output_file,
+            ),
+            in_text=self.md_engine,
         )
 
     def run_heating(self) -> None:
         """Run heating simulation (NVT)."""
         cmd = [
+            *self.launch_prefix,
             self.md_engine,
             "-O",
+            *self.engine_args,
             "-i", "heat.in",
             "-o", "heat.out",
             "-p", "system.prmtop",
@@ -490,17 +977,26 @@ class SimulationRunner:
             "-ref", "min2.rst7",
         ]
 
-        self.run_command(
-            cmd,
-            f"Heating (0 -> {self.config.temperature} K)",
-            check_output=self.config.output_dir / "heat.rst7",
+        self._run_cached(
+            "heat",
+            ["heat.in", "system.prmtop", "min2.rst7"],
+            ["heat.rst7", "heat.out"],
+            lambda: self.run_command(
+                cmd,
+                f"Heating (0 -> {self.config.temperature} K)",
+                check_output=self.config.output_dir / "heat.rst7",
+                log_name="heat",
+            ),
+            in_text=self.md_engine,
         )
 
     def run_equilibration(self) -> None:
         """Run equilibration simulation (NPT)."""
         cmd = [
+            *self.launch_prefix,
             self.md_engine,
             "-O",
+            *self.engine_args,
             "-i", "equil.in",
             "-o", "equil.out",
             "-p", "system.prmtop",
@@ -510,17 +1006,29 @@ class SimulationRunner:
             "-ref", "heat.rst7",
         ]
 
-        self.run_command(
-            cmd,
-            "Equilibration (NPT, 500 ps)",
-            check_output=self.config.output_dir / "equil.rst7",
+        outputs = ["equil.rst7", "equil.out"]
+        if self.config.equil_trajectory:
+            outputs.append("equil.nc")
+        self._run_cached(
+            "equil",
+            ["equil.in", "system.prmtop", "heat.rst7"],
+            outputs,
+            lambda: self.run_command(
+                cmd,
+                "Equilibration (NPT, 500 ps)",
+                check_output=self.config.output_dir / "equil.rst7",
+                log_name="equil",
+            ),
+            in_text=self.md_engine,
         )
 
     def run_production(self) -> None:
-        """Run production MD simulation (NPT)."""
+        """Run production MD simulation (NPT). Never cached."""
         cmd = [
+            *self.launch_prefix,
             self.md_engine,
             "-O",
+            *self.engine_args,
             "-i", "prod.in",
             "-o", "prod.out",
             "-p", "system.prmtop",
@@ -533,13 +1041,92 @@ class SimulationRunner:
             cmd,
             f"Production MD (NPT, {self.config.sim_time_ns} ns)",
             check_output=self.config.output_dir / "prod.rst7",
+            log_name="prod",
+        )
+
+    def fit_cutoff_to_box(self, generator: InputFileGenerator) -> None:
+        """Adapt the cutoff and engine flags to a small solvated box.
+
+        pmemd requires cut + skinnb to fit in half of the shortest box side.
+        If system.inpcrd is smaller than that, the minimization and MD
+        inputs are rewritten with the largest cutoff that fits. The box is
+        taken NPT_BOX_MARGIN smaller than built, since it shrinks during
+        equilibration. pmemd.cuda also refuses boxes under three pair-list
+        cells per side unless it is run with -AllowSmallBox.
+        """
+        box = _parse_inpcrd_box(self.config.output_dir / "system.inpcrd")
+        if box is None:
+            logger.debug("No periodic box found in system.inpcrd; cutoff unchanged")
+            return
+
+        side = NPT_BOX_MARGIN * min(box)
+        max_cut = int((side / 2 - PAIRLIST_SKIN) * 10) / 10
+        if max_cut <= 0:
+            raise RuntimeError(
+                f"Box side {min(box):.1f} A is too small for any cutoff; "
+                "increase the box buffer"
+            )
+        if max_cut < DEFAULT_CUTOFF:
+            if max_cut < 8.0:
+                logger.warning(
+                    f"Box side {min(box):.1f} A only allows a {max_cut} A cutoff; "
+                    "consider a larger box buffer"
+                )
+
+            generator.cut = max_cut
+            files = {
+                "min.in": generator.generate_minimization_input(with_restraints=True),
+                "min2.in": generator.generate_minimization_input(with_restraints=False),
+                "heat.in": generator.generate_heating_input(),
+                "equil.in": generator.generate_equilibration_input(),
+                "prod.in": generator.generate_production_input(),
+            }
+            for filename, content in files.items():
+                (self.config.output_dir / filename).write_bytes(content.encode())
+            logger.info(f"Cutoff reduced to {max_cut} A for a {min(box):.1f} A box side")
+
+        if self.md_engine.startswith("pmemd.cuda") and side < 3 * (generator.cut + PAIRLIST_SKIN):
+            self.engine_args = ["-AllowSmallBox"]
+            logger.info(f"Running pmemd.cuda with -AllowSmallBox for a {min(box):.1f} A box side")
+
+    def limit_trajectory_to_solute(self, generator: InputFileGenerator) -> None:
+        """Rewrite prod.in so the trajectory holds only the solute (ntwprt).
+
+        tleap writes the solute first, so the solute is the atoms before
+        the first water or ion in system.pdb.
+        """
+        n_solute = _count_solute_atoms(self.config.output_dir / "system.pdb")
+        if n_solute == 0:
+            logger.warning("No solute atoms found in system.pdb; writing all atoms to prod.nc")
+            return
+
+        generator.n_solute = n_solute
+        (self.config.output_dir / "prod.in").write_bytes(
+            generator.generate_production_input().encode()
         )
+        logger.info(f"Production trajectory limited to {n_solute} solute atoms")
+
+    def run_md_stages(self) -> None:
+        """Run minimization, heating, equilibration and production in order.
+
+        Each stage restarts from the previous stage's restart file, so the
+        stages run sequentially in one engine process each (pmemd's
+        ``-groupfile`` runs replicas concurrently and cannot chain them).
+        """
+        generator = InputFileGenerator(self.config)
+        self.fit_cutoff_to_box(generator)
+        if self.config.solute_trajectory:
+            self.limit_trajectory_to_solute(generator)
+        self.run_minimization(stage=1)
+        self.run_minimization(stage=2)
+        self.run_heating()
+        self.run_equilibration()
+        self.run_production()
 
     def run_all(self) -> None:
         """Execute the full MD workflow."""
         # Setup
         self.setup_environment()
-        self.detect_md_engine()
 
         # Create output directory
         self.config.output_dir.mkdir(parents=True, exist_ok=True)
@@ -561,11 +1148,9 @@ class SimulationRunner:
 
         # Run simulations
         self.run_tleap()
-        self.run_minimization(stage=1)
-        self.run_minimization(stage=2)
-        self.run_heating()
-        self.run_equilibration()
-        self.run_production()
+        if self.config.hmr:
+            self.run_hmr()
+        self.run_md_stages()
 
         # Print summary
         self.print_summary()
@@ -583,23 +1168,36 @@ class SimulationRunner:
         print("  - system.prmtop    : Topology file")
         print("  - system.inpcrd    : Initial coordinates")
         print("  - prod.rst7        : Final restart file")
-        print("  - prod.nc          : Production trajectory")
+        if self.config.solute_trajectory:
+            print("  - prod.nc          : Production trajectory (solute only)")
+        else:
+            print("  - prod.nc          : Production trajectory")
         print("  - prod.out         : Production output")
         print()
         print("Analysis commands:")
+        if self.config.solute_trajectory:
+            print("  # prod.nc has no water/ions: strip them from the topology first")
+            print("  cpptraj << EOF")
+            print("  parm system.prmtop")
+            print("  parmstrip :WAT,HOH,Na+,Cl-")
+            print("  parmwrite out solute.prmtop")
+            print("  run")
+            print("  EOF")
+            print()
+        topology = "solute.prmtop" if self.config.solute_trajectory else "system.prmtop"
         print("  # Load trajectory in cpptraj")
-        print("  cpptraj -p system.prmtop -y prod.nc")
+        print(f"  cpptraj -p {topology} -y prod.nc")
         print()
         print("  # Calculate RMSD")
         print("  cpptraj << EOF")
-        print("  parm system.prmtop")
+        print(f"  parm {topology}")
         print("  trajin prod.nc")
         print("  rms first @CA out rmsd.dat")
         print("  run")
         print("  EOF")
         print()
         print("  # Extract frames as PDB")
-        print("  cpptraj -p system.prmtop -y prod.nc -x frames.pdb")
+        print(f"  cpptraj -p {topology} -y prod.nc -x frames.pdb")
         print()
 
 
@@ -619,6 +1217,10 @@ def print_config(config: SimulationConfig) -> None:
     print(f"Box buffer:      {config.box_buffer} \u00c5")
     print(f"Salt conc:       {config.salt_conc} M")
     print(f"Simulation:      {config.sim_time_ns} ns")
+    print(f"Timestep:        {'4 fs (HMR)' if config.hmr else '2 fs'}")
+    if config.use_gpu:
+        print(f"GPU device:      {config.gpu_device or 'inherited (CUDA_VISIBLE_DEVICES)'}")
+        print(f"GPU precision:   {config.precision}")
     print()
 
 
@@ -678,14 +1280,16 @@ Examples:
     parser.add_argument(
         "-f", "--forcefield",
         default="ff19SB",
-        choices=["ff14SB", "ff19SB"],
+        type=str.lower,
+        choices=list(FORCEFIELD_MAP),
         help="Force field (default: ff19SB)",
     )
     parser.add_argument(
         "-w", "--water",
         dest="water_model",
         default="opc",
-        choices=["tip3p", "opc", "tip4pew"],
+        type=str.lower,
+        choices=list(WATER_MODEL_MAP),
         help="Water model (default: opc)",
     )
     parser.add_argument(
@@ -694,6 +1298,49 @@ Examples:
         action="store_true",
         help="Force CPU execution (no GPU)",
     )
+    parser.add_argument(
+        "-g", "--gpu-index",
+        dest="gpu_device",
+        default=None,
+        help="GPU device to use, e.g. 1 or cuda:1 (default: keep CUDA_VISIBLE_DEVICES)",
+    )
+    parser.add_argument(
+        "--precision",
+        default="SPFP",
+        type=str.upper,
+        choices=GPU_PRECISIONS,
+        help="pmemd.cuda precision model (default: SPFP)",
+    )
+    parser.add_argument(
+        "--hmr",
+        action=argparse.BooleanOptionalAction,
+        default=True,
+        help="Hydrogen mass repartitioning with a 4 fs timestep (default: on)",
+    )
+    parser.add_argument(
+        "--no-tleap-check",
+        dest="run_tleap_check",
+        action="store_false",
+        help="Skip tleap's structure check (for already validated inputs)",
+    )
+    parser.add_argument(
+        "--equil-traj",
+        dest="equil_trajectory",
+        action="store_true",
+        help="Write an equilibration trajectory (equil.nc, every 5 ps)",
+    )
+    parser.add_argument(
+        "--solute-traj",
+        dest="solute_trajectory",
+        action="store_true",
+        help="Write only solute atoms (no water/ions) to prod.nc",
+    )
+    parser.add_argument(
+        "--no-cache",
+        dest="stage_cache",
+        action="store_false",
+        help="Re-run every stage instead of reusing unchanged ones from <outdir>/.cache",
+    )
     parser.add_argument(
         "-d", "--dry-run",
         dest="dry_run",
@@ -742,6 +1389,13 @@ def main() -> int:
             forcefield=args.forcefield,
             water_model=args.water_model,
             use_gpu=not args.use_cpu,
+            gpu_device=args.gpu_device,
+            precision=args.precision,
+            hmr=args.hmr,
+            equil_trajectory=args.equil_trajectory,
+            run_tleap_check=args.run_tleap_check,
+            stage_cache=args.stage_cache,
+            solute_trajectory=args.solute_trajectory,
             dry_run=args.dry_run,
             output_dir=args.output_dir if str(args.output_dir) != "." else Path("."),
         )
@@ -12,12 +12,16 @@ Tools:
    - Equilibration (NPT)
    - Production MD (NPT)
 
-2. amber_prepare_system: Prepare a protein system with tleap only
+2. amber_run_protein_md_batch: Run the MD workflow for many proteins across GPUs
+   - One independent single-GPU simulation per PDB file
+   - Simulations are scheduled one per GPU at a time
+
+3. amber_prepare_system: Prepare a protein system with tleap only
    - Solvation in water box
    - Ion addition for neutralization
    - Outputs topology and coordinate files
 
-3. amber_generate_input_files: Generate Amber input files without running simulations
+4. amber_generate_input_files: Generate Amber input files without running simulations
    - Creates all input files for inspection/customization
    - Useful for dry-run preparation
 
@@ -6,17 +6,27 @@ using the Amber software suite.
 
 Tools:
 1. amber_run_protein_md: Run a complete MD simulation workflow for a single protein
-2. amber_prepare_system: Prepare a protein system with tleap (solvation, ionization)
-3. amber_generate_input_files: Generate Amber input files without running simulations
+2. amber_run_protein_md_batch: Run the workflow for many proteins in parallel across GPUs
+3. amber_prepare_system: Prepare a protein system with tleap (solvation, ionization)
+4. amber_generate_input_files: Generate Amber input files without running simulations
 """
 
+import hashlib
 import os
+import queue
+import shutil
+import signal
 import subprocess
 import sys
-from dataclasses import dataclass, field
+import threading
+from collections import Counter
+from concurrent.futures import ThreadPoolExecutor
+from dataclasses import dataclass, field, replace
 from datetime import datetime
+from functools import cached_property, lru_cache
 from pathlib import Path
-from typing import Annotated, Optional
+from types import MappingProxyType
+from typing import Annotated, Callable, Optional
 
 from fastmcp import FastMCP
 from loguru import logger
@@ -26,30 +36,281 @@ PROJECT_ROOT = Path(__file__).parent.parent.parent.resolve()
 DEFAULT_OUTPUT_DIR = PROJECT_ROOT / "results"
 AMBER_ENV_DIR = PROJECT_ROOT / "env"
 
-# Ensure output directory exists
-DEFAULT_OUTPUT_DIR.mkdir(parents=True, exist_ok=True)
+# Default output directories are md_<job>_<run start>_<sequence>; the
+# sequence only breaks ties between runs started in the same second
+_RUN_STAMP_LOCK = threading.Lock()
+_last_run_stamp = ""
+_run_stamp_seq = 0
 
 # MCP server instance
 simulation_mcp = FastMCP(name="simulation")
 
-# Force field mappings
-FORCEFIELD_MAP = {
-    "ff14SB": "leaprc.protein.ff14SB",
+# Force field mappings (keys are lower-case; lookups are case-insensitive)
+FORCEFIELD_MAP = MappingProxyType({
     "ff14sb": "leaprc.protein.ff14SB",
-    "ff19SB": "leaprc.protein.ff19SB",
     "ff19sb": "leaprc.protein.ff19SB",
-}
+})
 
-# Water model mappings
-WATER_MODEL_MAP = {
+# Water model mappings (keys are lower-case; lookups are case-insensitive)
+WATER_MODEL_MAP = MappingProxyType({
     "tip3p": ("leaprc.water.tip3p", "TIP3PBOX"),
-    "TIP3P": ("leaprc.water.tip3p", "TIP3PBOX"),
     "opc": ("leaprc.water.opc", "OPCBOX"),
-    "OPC": ("leaprc.water.opc", "OPCBOX"),
     "tip4pew": ("leaprc.water.tip4pew", "TIP4PEWBOX"),
-    "TIP4PEW": ("leaprc.water.tip4pew", "TIP4PEWBOX"),
+})
+
+# MD engines in order of preference
+MD_ENGINES = ("pmemd.cuda", "pmemd", "sander")
+
+# pmemd.cuda precision models (pmemd.cuda_<model>); plain pmemd.cuda is SPFP
+GPU_PRECISIONS = ("SPFP", "DPFP", "SPXP")
+
+# Direct-space cutoff in Angstrom, and pmemd's default pair-list skin (skinnb);
+# the cutoff plus skin must fit in half of the shortest box side
+DEFAULT_CUTOFF = 10.0
+PAIRLIST_SKIN = 2.0
+
+# Fraction of the tleap box side assumed to survive NPT equilibration
+# (the box typically shrinks by a few percent as the density settles)
+NPT_BOX_MARGIN = 0.95
+
+# Box angles of rectangular and truncated octahedral periodic boxes
+BOX_ANGLES = (90.0, 109.4712206)
+
+# Engine environment defaults (values already set by the user win)
+ENGINE_ENV_DEFAULTS = {
+    "CUDA_CACHE_MAXSIZE": "2147483648",  # Keep JIT-compiled kernels across runs
+    "CUDA_CACHE_DISABLE": "0",
+    "CUDA_MODULE_LOADING": "LAZY",  # Load kernels on first use to shorten startup
+    "CUDA_DEVICE_ORDER": "PCI_BUS_ID",  # Match nvidia-smi device indices
+    "OMP_NUM_THREADS": "1",  # Avoid CPU oversubscription around the GPU driver thread
+    "MKL_NUM_THREADS": "1",
 }
 
+# Caller environment passed to Amber tools; variables set by amber.sh are
+# added on top, so the child environment stays small on crowded HPC nodes
+ENV_PASSTHROUGH = frozenset({
+    "PATH", "LD_LIBRARY_PATH", "HOME", "USER", "LOGNAME", "SHELL", "TERM",
+    "TMPDIR", "LANG", "PYTHONPATH", "PYTHONHOME", "PERL5LIB", "VIRTUAL_ENV",
+})
+ENV_PASSTHROUGH_PREFIXES = ("AMBER", "CUDA", "NVIDIA_", "LC_", "OMP_", "MKL_", "CONDA_", "SLURM_")
+
+# Shell bookkeeping variables printed by `env` that are not part of amber.sh
+SHELL_ENV_VARS = frozenset({"_", "SHLVL", "PWD", "OLDPWD"})
+
+# Residue names of the water and ions added by tleap (PDB columns 18-20)
+SOLVENT_RESIDUES = frozenset({b"WAT", b"HOH", b"Na+", b"Cl-"})
+
+
+def _run_stamp() -> str:
+    """Return "<YYYYmmdd_HHMMSS>_<sequence>" for a run starting now."""
+    global _last_run_stamp, _run_stamp_seq
+    stamp = datetime.now().strftime("%Y%m%d_%H%M%S")
+    with _RUN_STAMP_LOCK:
+        if stamp == _last_run_stamp:
+            _run_stamp_seq += 1
+        else:
+            _last_run_stamp, _run_stamp_seq = stamp, 0
+        return f"{stamp}_{_run_stamp_seq:04d}"
+
+
+@lru_cache(maxsize=32)
+def _which(name: str, path: str) -> Optional[str]:
+    """Locate an executable on the given PATH (cached per process)."""
+    return shutil.which(name, path=path)
+
+
+@lru_cache(maxsize=8)
+def _select_md_engine(path: str, use_gpu: bool, precision: str = "SPFP") -> Optional[str]:
+    """Return the preferred MD engine available on PATH, if any.
+
+    On GPUs the build for the requested precision model is preferred,
+    falling back to pmemd.cuda (SPFP).
+    """
+    for engine in (f"pmemd.cuda_{precision}",) + MD_ENGINES:
+        if engine.startswith("pmemd.cuda") and not use_gpu:
+            continue
+        if _which(engine, path) is not None:
+            return engine
+    return None
+
+
+@lru_cache(maxsize=None)
+def _gpu_numa_binding(device_id: str) -> Optional[tuple[str, int]]:
+    """Return (local_cpulist, numa_node) for a GPU's PCIe slot, if known."""
+    if shutil.which("nvidia-smi") is None:
+        return None
+    result = subprocess.run(
+        ["nvidia-smi", "-i", device_id, "--query-gpu=pci.bus_id", "--format=csv,noheader"],
+        capture_output=True,
+        text=True,
+    )
+    if result.returncode != 0:
+        return None
+
+    # nvidia-smi reports an 8-digit PCI domain ("00000000:3B:00.0"); sysfs uses 4
+    bus_id = result.stdout.strip().lower()[-12:]
+    device_dir = Path("/sys/bus/pci/devices") / bus_id
+    try:
+        cpulist = (device_dir / "local_cpulist").read_text().strip()
+        numa_node = int((device_dir / "numa_node").read_text())
+    except (OSError, ValueError):
+        return None
+    return cpulist, numa_node
+
+
+def _parse_cpulist(cpulist: str) -> set[int]:
+    """Expand a sysfs CPU list ("0-3,8,10-11") into CPU numbers."""
+    cpus: set[int] = set()
+    for part in cpulist.split(","):
+        if not part:
+            continue
+        first, _, last = part.partition("-")
+        cpus.update(range(int(first), int(last or first) + 1))
+    return cpus
+
+
+def _read_tail(path: Path, size: int = 8192) -> str:
+    """Return the last size bytes of a (possibly very large) log file."""
+    with open(path, "rb") as f:
+        f.seek(0, os.SEEK_END)
+        f.seek(max(0, f.tell() - size))
+        return f.read().decode(errors="replace")
+
+
+def _parse_inpcrd_box(inpcrd_file: Path) -> Optional[tuple[float, float, float]]:
+    """Read the box lengths (A) from the last line of an Amber inpcrd file.
+
+    Returns None unless that line looks like a periodic box line, so the
+    last coordinate line of a non-periodic file is not mistaken for one.
+    """
+    try:
+        line = _read_tail(inpcrd_file, 256).rstrip().rsplit("\n", 1)[-1]
+        # Box line is 6F12.7: a, b, c, alpha, beta, gamma
+        values = [float(line[i:i + 12]) for i in range(0, 72, 12)]
+    except (OSError, ValueError):
+        return None
+    lengths, angles = values[:3], values[3:]
+    if min(lengths) <= 0:
+        return None
+    if not all(any(abs(angle - ref) < 0.5 for ref in BOX_ANGLES) for angle in angles):
+        return None
+    return tuple(lengths)
+
+
+@lru_cache(maxsize=1)
+def _amber_env_delta(amber_sh: Path, mtime: float) -> dict[str, str]:
+    """Return the variables amber.sh sets or changes.
+
+    amber.sh is sourced in the whitelisted environment the tools run in,
+    so a variable it exports is kept even if the caller already has it
+    (e.g. from sourcing amber.sh in .bashrc). Sourced once per process;
+    mtime is part of the cache key so that edits to amber.sh are picked up.
+    """
+    base_env = _passthrough_env()
+    # --norc: bash may otherwise read ~/.bashrc (e.g. when stdin is a
+    # socket) and export the user's shell setup along with amber.sh
+    result = subprocess.run(
+        ["/bin/bash", "--norc", "--noprofile", "-c", f"source {amber_sh} && env"],
+        stdin=subprocess.DEVNULL,
+        capture_output=True,
+        text=True,
+        env=base_env,
+    )
+    if result.returncode != 0:
+        raise RuntimeError(f"Failed to source amber.sh: {result.stderr}")
+
+    delta = {}
+    for line in result.stdout.splitlines():
+        if "=" in line:
+            key, _, value = line.partition("=")
+            if key not in SHELL_ENV_VARS and base_env.get(key) != value:
+                delta[key] = value
+    return delta
+
+
+def _passthrough_env() -> dict[str, str]:
+    """Return the caller's environment variables that Amber tools need."""
+    return {
+        key: value
+        for key, value in os.environ.items()
+        if key in ENV_PASSTHROUGH or key.startswith(ENV_PASSTHROUGH_PREFIXES)
+    }
+
+
+def _detect_gpus() -> list[str]:
+    """Return the GPUs this server may use.
+
+    The server's CUDA_VISIBLE_DEVICES wins when set; otherwise every GPU
+    listed by nvidia-smi is returned.
+    """
+    visible = os.environ.get("CUDA_VISIBLE_DEVICES")
+    if visible is not None:
+        return [gpu.strip() for gpu in visible.split(",") if gpu.strip()]
+    return list(_nvidia_smi_gpus())
+
+
+@lru_cache(maxsize=1)
+def _nvidia_smi_gpus() -> tuple[str, ...]:
+    """Return the indices of the GPUs listed by nvidia-smi (queried once)."""
+    if shutil.which("nvidia-smi") is None:
+        return ()
+    result = subprocess.run(
+        ["nvidia-smi", "--query-gpu=index", "--format=csv,noheader"],
+        capture_output=True,
+        text=True,
+    )
+    if result.returncode != 0:
+        return ()
+    return tuple(line.strip() for line in result.stdout.splitlines() if line.strip())
+
+
+def _unique_job_names(pdb_files: list[Path]) -> list[str]:
+    """Return one job name per PDB file, unique within the batch.
+
+    Names are the file stems; repeated stems (e.g. a/protein.pdb and
+    b/protein.pdb) get their parent directory prepended, then a counter,
+    so no two jobs share an md_<name> output directory.
+    """
+    stem_counts = Counter(path.stem for path in pdb_files)
+    names: list[str] = []
+    for path in pdb_files:
+        name = path.stem
+        if stem_counts[name] > 1:
+            name = f"{Path(os.path.abspath(path)).parent.name}_{name}"
+        base, n = name, 2
+        while name in names:
+            name = f"{base}_{n}"
+            n += 1
+        names.append(name)
+    return names
+
+
+def _count_solute_atoms(pdb_file: Path) -> int:
+    """Count the atoms before the first water or ion residue in a tleap PDB."""
+    count = 0
+    with open(pdb_file, "rb") as f:
+        for line in f:
+            if line.startswith((b"ATOM  ", b"HETATM")):
+                if line[17:20] in SOLVENT_RESIDUES:
+                    break
+                count += 1
+    return count
+
+
+def _read_prmtop_natom(prmtop_file: Path) -> int:
+    """Read the atom count (NATOM) from the POINTERS section of a prmtop file.
+
+    POINTERS is the second section of the file, so only its header is read.
+    Returns 0 if the section is not found.
+    """
+    with open(prmtop_file, "rb") as f:
+        lines = f.read(8192).splitlines()
+    for i, line in enumerate(lines[:-2]):
+        if line.startswith(b"%FLAG POINTERS"):
+            # Skip the %FORMAT(10I8) line; NATOM is the first value
+            return int(lines[i + 2][:8])
+    return 0
+
 
 @dataclass
 class SimulationConfig:
@@ -65,6 +326,12 @@ class SimulationConfig:
     water_model: str = "opc"
     use_gpu: bool = True
     gpu_device: str = "cuda:0"  # GPU device selection (e.g., "cuda:0", "cuda:1")
+    hmr: bool = True  # Hydrogen mass repartitioning + 4 fs timestep
+    equil_trajectory: bool = False  # Write equil.nc snapshots (every 5 ps)
+    run_tleap_check: bool = True  # Run tleap "check" on the unsolvated protein
+    stage_cache: bool = True  # Reuse outputs of unchanged stages (explicit output_dir only)
+    solute_trajectory: bool = False  # Write only solute atoms to prod.nc (ntwprt)
+    precision: str = "SPFP"  # pmemd.cuda precision model (SPFP, DPFP or SPXP)
     dry_run: bool = False
     output_dir: Path = field(default_factory=Path)
 
@@ -81,24 +348,45 @@ class SimulationConfig:
         if isinstance(self.output_dir, str):
             self.output_dir = Path(self.output_dir)
 
-        if not self.pdb_file.exists():
-            raise FileNotFoundError(f"PDB file not found: {self.pdb_file}")
-
-        self.pdb_file = self.pdb_file.resolve()
+        try:
+            os.stat(self.pdb_file)
+        except FileNotFoundError:
+            raise FileNotFoundError(f"PDB file not found: {self.pdb_file}") from None
+        self.pdb_file = Path(os.path.realpath(self.pdb_file))
 
         if not self.job_name:
             self.job_name = self.pdb_file.stem
 
         if not self.output_dir or str(self.output_dir) == ".":
-            self.output_dir = DEFAULT_OUTPUT_DIR / f"md_{self.job_name}_{datetime.now().strftime('%Y%m%d_%H%M%S')}"
+            self.output_dir = DEFAULT_OUTPUT_DIR / f"md_{self.job_name}_{_run_stamp()}"
+            # A fresh directory per run can never hit the cache; filling it
+            # would only double the disk usage
+            self.stage_cache = False
+        # Resolved once here so artifact paths don't each pay for a realpath()
+        self.output_dir = Path(os.path.realpath(self.output_dir))
+
+        ff_key = self.forcefield.lower()
+        if ff_key not in FORCEFIELD_MAP:
+            raise ValueError(
+                f"Unknown force field: {self.forcefield} "
+                f"(supported: {', '.join(FORCEFIELD_MAP)})"
+            )
+        self.ff_source = FORCEFIELD_MAP[ff_key]
 
-        if self.forcefield not in FORCEFIELD_MAP:
-            raise ValueError(f"Unknown force field: {self.forcefield}")
-        self.ff_source = FORCEFIELD_MAP[self.forcefield]
+        water_key = self.water_model.lower()
+        if water_key not in WATER_MODEL_MAP:
+            raise ValueError(
+                f"Unknown water model: {self.water_model} "
+                f"(supported: {', '.join(WATER_MODEL_MAP)})"
+            )
+        self.water_source, self.water_box = WATER_MODEL_MAP[water_key]
 
-        if self.water_model not in WATER_MODEL_MAP:
-            raise ValueError(f"Unknown water model: {self.water_model}")
-        self.water_source, self.water_box = WATER_MODEL_MAP[self.water_model]
+        self.precision = self.precision.upper()
+        if self.precision not in GPU_PRECISIONS:
+            raise ValueError(
+                f"Unknown GPU precision model: {self.precision} "
+                f"(supported: {', '.join(GPU_PRECISIONS)})"
+            )
 
         # Parse GPU device string (e.g., "cuda:0" -> "0", "cuda:1" -> "1")
         if self.gpu_device.lower().startswith("cuda:"):
@@ -108,26 +396,22 @@ class SimulationConfig:
             self.cuda_device_id = self.gpu_device
 
 
-class InputFileGenerator:
-    """Generate Amber input files for MD simulations."""
+# Input file templates, built once at import and filled per simulation
+# Runs before solvatebox so only the protein, not the solvent, is checked
+TLEAP_CHECK_BLOCK = """# Check for problems
+check mol
 
-    def __init__(self, config: SimulationConfig) -> None:
-        self.config = config
+"""
 
-    def generate_tleap_input(self) -> str:
-        """Generate tleap.in for system preparation."""
-        return f"""# Load force field
-source {self.config.ff_source}
-source {self.config.water_source}
+TLEAP_TEMPLATE = """# Load force field
+source {ff_source}
+source {water_source}
 
 # Load protein
-mol = loadpdb {self.config.pdb_file}
-
-# Check for problems
-check mol
+mol = loadpdb {pdb_file}
 
-# Solvate with water box
-solvatebox mol {self.config.water_box} {self.config.box_buffer}
+{check_block}# Solvate with water box
+solvatebox mol {water_box} {box_buffer}
 
 # Add ions to neutralize the system
 addIons2 mol Na+ 0
@@ -142,10 +426,12 @@ savepdb mol system.pdb
 quit
 """
 
-    def generate_minimization_input(self, with_restraints: bool = True) -> str:
-        """Generate minimization input file."""
-        if with_restraints:
-            return """Minimization
+HMR_INPUT = """HMassRepartition
+outparm system.prmtop
+quit
+"""
+
+MIN_TEMPLATE = """Minimization
  &cntrl
    imin=1,
    maxcyc=5000,
@@ -154,33 +440,30 @@ quit
    ntr=1,
    restraint_wt=10.0,
    restraintmask='!@H=',
-   cut=10.0,
+   cut={cut},
    ntpr=100,
  /
 """
-        else:
-            return """Minimization (no restraints)
+
+MIN2_TEMPLATE = """Minimization (no restraints)
  &cntrl
    imin=1,
    maxcyc=5000,
    ncyc=2500,
    ntb=1,
    ntr=0,
-   cut=10.0,
+   cut={cut},
    ntpr=100,
  /
 """
 
-    def generate_heating_input(self) -> str:
-        """Generate heating input file (NVT)."""
-        nsteps_heat = 25000
-        return f"""Heating from 0 to {self.config.temperature} K
+HEAT_TEMPLATE = """Heating from 0 to {temperature} K
  &cntrl
    imin=0,
    irest=0,
    ntx=1,
    ntb=1,
-   cut=10.0,
+   cut={cut},
    ntr=1,
    restraint_wt=5.0,
    restraintmask='@CA',
@@ -189,24 +472,21 @@ quit
    ntc=2,
    ntf=2,
    tempi=0.0,
-   temp0={self.config.temperature},
+   temp0={temperature},
    ntt=3,
    gamma_ln=2.0,
    ig=-1,
    ntpr=500,
-   ntwx=500,
+   ntwx=0,
    ntwr=5000,
    iwrap=1,
    nmropt=1,
  /
- &wt type='TEMP0', istep1=0, istep2={nsteps_heat}, value1=0.0, value2={self.config.temperature}, /
+ &wt type='TEMP0', istep1=0, istep2={nsteps_heat}, value1=0.0, value2={temperature}, /
  &wt type='END' /
 """
 
-    def generate_equilibration_input(self) -> str:
-        """Generate equilibration input file (NPT)."""
-        nsteps_equil = 250000
-        return f"""Equilibration (NPT)
+EQUIL_TEMPLATE = """Equilibration (NPT)
  &cntrl
    imin=0,
    irest=1,
@@ -215,29 +495,26 @@ quit
    pres0=1.0,
    ntp=1,
    taup=2.0,
-   cut=10.0,
+   cut={cut},
    ntr=1,
    restraint_wt=2.0,
    restraintmask='@CA',
-   nstlim={nsteps_equil},
-   dt=0.002,
+   nstlim={nstlim},
+   dt={dt},
    ntc=2,
    ntf=2,
-   temp0={self.config.temperature},
+   temp0={temperature},
    ntt=3,
    gamma_ln=2.0,
    ig=-1,
-   ntpr=500,
-   ntwx=500,
-   ntwr=10000,
+   ntpr={ntpr},
+   ntwx={ntwx},
+   ntwr={ntwr},
    iwrap=1,
  /
 """
 
-    def generate_production_input(self) -> str:
-        """Generate production MD input file (NPT)."""
-        nsteps_prod = int(self.config.sim_time_ns * 500000)
-        return f"""Production MD (NPT)
+PROD_TEMPLATE = """Production MD (NPT)
  &cntrl
    imin=0,
    irest=1,
@@ -246,42 +523,131 @@ quit
    pres0=1.0,
    ntp=1,
    taup=2.0,
-   cut=10.0,
+   cut={cut},
    ntr=0,
-   nstlim={nsteps_prod},
-   dt=0.002,
+   nstlim={nstlim},
+   dt={dt},
    ntc=2,
    ntf=2,
-   temp0={self.config.temperature},
+   temp0={temperature},
    ntt=3,
    gamma_ln=2.0,
    ig=-1,
-   ntpr=5000,
-   ntwx=5000,
-   ntwr=50000,
+   ntpr={ntpr},
+   ntwx={ntwx},
+{ntwprt}   ntwr={ntwr},
    iwrap=1,
    ioutfm=1,
  /
 """
 
+# Inputs that are fixed at the default cutoff, encoded once
+HMR_INPUT_BYTES = HMR_INPUT.encode()
+MIN_INPUT_BYTES = MIN_TEMPLATE.format(cut=DEFAULT_CUTOFF).encode()
+MIN2_INPUT_BYTES = MIN2_TEMPLATE.format(cut=DEFAULT_CUTOFF).encode()
+
+
+class InputFileGenerator:
+    """Generate Amber input files for MD simulations."""
+
+    def __init__(self, config: SimulationConfig, cut: float = DEFAULT_CUTOFF) -> None:
+        self.config = config
+        self.cut = cut
+        self.n_solute: Optional[int] = None  # Atoms written to prod.nc (all if None)
+
+    def timestep(self) -> float:
+        """Equilibration/production timestep in ps (4 fs with HMR, else 2 fs)."""
+        return 0.004 if self.config.hmr else 0.002
+
+    def steps_per_ns(self) -> int:
+        """Number of MD steps per ns at the equilibration/production timestep."""
+        return 250000 if self.config.hmr else 500000
+
+    def generate_tleap_input(self) -> str:
+        """Generate tleap.in for system preparation."""
+        return TLEAP_TEMPLATE.format(
+            ff_source=self.config.ff_source,
+            water_source=self.config.water_source,
+            pdb_file=self.config.pdb_file,
+            check_block=TLEAP_CHECK_BLOCK if self.config.run_tleap_check else "",
+            water_box=self.config.water_box,
+            box_buffer=self.config.box_buffer,
+        )
+
+    def generate_hmr_input(self) -> str:
+        """Generate ParmEd input for hydrogen mass repartitioning."""
+        return HMR_INPUT
+
+    def generate_minimization_input(self, with_restraints: bool = True) -> str:
+        """Generate minimization input file."""
+        template = MIN_TEMPLATE if with_restraints else MIN2_TEMPLATE
+        return template.format(cut=self.cut)
+
+    def generate_heating_input(self) -> str:
+        """Generate heating input file (NVT)."""
+        return HEAT_TEMPLATE.format(
+            nsteps_heat=25000,
+            temperature=self.config.temperature,
+            cut=self.cut,
+        )
+
+    def generate_equilibration_input(self) -> str:
+        """Generate equilibration input file (NPT)."""
+        steps_per_ns = self.steps_per_ns()
+        ntwx_equil = steps_per_ns // 200 if self.config.equil_trajectory else 0
+        return EQUIL_TEMPLATE.format(
+            nstlim=steps_per_ns // 2,
+            dt=self.timestep(),
+            cut=self.cut,
+            temperature=self.config.temperature,
+            ntpr=steps_per_ns // 1000,
+            ntwx=ntwx_equil,
+            ntwr=steps_per_ns // 50,
+        )
+
+    def generate_production_input(self) -> str:
+        """Generate production MD input file (NPT)."""
+        steps_per_ns = self.steps_per_ns()
+        return PROD_TEMPLATE.format(
+            nstlim=int(self.config.sim_time_ns * steps_per_ns),
+            dt=self.timestep(),
+            cut=self.cut,
+            temperature=self.config.temperature,
+            ntpr=steps_per_ns // 100,
+            ntwx=steps_per_ns // 100,
+            ntwr=steps_per_ns // 10,
+            ntwprt=f"   ntwprt={self.n_solute},\n" if self.n_solute else "",
+        )
+
     def write_all_input_files(self, output_dir: Path) -> list[dict]:
         """Write all input files to the output directory."""
         files = {
-            "tleap.in": self.generate_tleap_input(),
-            "min.in": self.generate_minimization_input(with_restraints=True),
-            "min2.in": self.generate_minimization_input(with_restraints=False),
-            "heat.in": self.generate_heating_input(),
-            "equil.in": self.generate_equilibration_input(),
-            "prod.in": self.generate_production_input(),
+            "tleap.in": self.generate_tleap_input().encode(),
+            "min.in": MIN_INPUT_BYTES,
+            "min2.in": MIN2_INPUT_BYTES,
+            "heat.in": self.generate_heating_input().encode(),
+            "equil.in": self.generate_equilibration_input().encode(),
+            "prod.in": self.generate_production_input().encode(),
         }
+        if self.cut != DEFAULT_CUTOFF:
+            files["min.in"] = self.generate_minimization_input(with_restraints=True).encode()
+            files["min2.in"] = self.generate_minimization_input(with_restraints=False).encode()
+        if self.config.hmr:
+            files["hmr.in"] = HMR_INPUT_BYTES
+
+        # Overlap per-file metadata latency on network filesystems
+        with ThreadPoolExecutor(max_workers=len(files)) as executor:
+            list(executor.map(
+                lambda item: (output_dir / item[0]).write_bytes(item[1]),
+                files.items(),
+            ))
 
         artifacts = []
-        for filename, content in files.items():
+        for filename in files:
             filepath = output_dir / filename
-            filepath.write_text(content)
             artifacts.append({
                 "description": f"Input file: {filename}",
-                "path": str(filepath.resolve())
+                "path": str(filepath)
             })
             logger.debug(f"Created {filepath}")
 
@@ -293,11 +659,16 @@ class SimulationRunner:
 
     def __init__(self, config: SimulationConfig) -> None:
         self.config = config
-        self.md_engine: Optional[str] = None
-        self.env: dict = os.environ.copy()
+        self.env: dict = _passthrough_env()
+        self.launch_prefix: list[str] = []  # numactl binding for the MD engine
+        self.engine_args: list[str] = []  # Extra MD engine flags (e.g. -AllowSmallBox)
+
+    def setup_environment(self, detect_engine: bool = True) -> None:
+        """Set up Amber environment variables.
 
-    def setup_environment(self) -> None:
-        """Set up Amber environment variables."""
+        Unless detect_engine is False (tleap-only use), the MD engine is
+        detected here so a missing engine fails before any stage runs.
+        """
         amber_sh = AMBER_ENV_DIR / "amber.sh"
         if not amber_sh.exists():
             raise RuntimeError(
@@ -305,85 +676,132 @@ class SimulationRunner:
                 "Run quick_setup.sh first."
             )
 
-        cmd = f"source {amber_sh} && env"
-        result = subprocess.run(
-            cmd,
-            shell=True,
-            capture_output=True,
-            text=True,
-            executable="/bin/bash",
-        )
-
-        if result.returncode != 0:
-            raise RuntimeError(f"Failed to source amber.sh: {result.stderr}")
-
-        for line in result.stdout.splitlines():
-            if "=" in line:
-                key, _, value = line.partition("=")
-                self.env[key] = value
+        self.env.update(_amber_env_delta(amber_sh, amber_sh.stat().st_mtime))
+        for key, value in ENGINE_ENV_DEFAULTS.items():
+            self.env.setdefault(key, value)
 
         # Set CUDA_VISIBLE_DEVICES for GPU selection
         if self.config.use_gpu:
             self.env["CUDA_VISIBLE_DEVICES"] = self.config.cuda_device_id
             logger.info(f"GPU device set: CUDA_VISIBLE_DEVICES={self.config.cuda_device_id}")
+            self.bind_to_gpu_numa_node()
 
         logger.info("Amber environment configured")
-
-    def detect_md_engine(self) -> str:
-        """Detect the best available MD engine."""
-        if self.config.use_gpu:
-            result = subprocess.run(
-                ["which", "pmemd.cuda"],
-                capture_output=True,
-                env=self.env,
+        if detect_engine:
+            _ = self.md_engine  # Cached; fail now rather than after tleap
+
+    def bind_to_gpu_numa_node(self) -> None:
+        """Run the MD engine on the CPUs and memory local to the selected GPU.
+
+        pmemd.cuda drives the GPU from a single CPU thread; on multi-socket
+        hosts, letting it migrate across NUMA nodes slows kernel launches.
+        The GPU-local CPUs this process may use are all kept (not one core)
+        so concurrent jobs on the same GPU do not compete for a single CPU.
+        Only the MD engine is bound; tleap and ParmEd run unbound.
+        """
+        if _which("numactl", self.env.get("PATH", "")) is None:
+            logger.debug("numactl not found; not binding to the GPU's NUMA node")
+            return
+
+        binding = _gpu_numa_binding(self.config.cuda_device_id)
+        if binding is None:
+            logger.debug("GPU NUMA locality unknown; not binding")
+            return
+
+        local_cpulist, numa_node = binding
+        try:
+            cpus = _parse_cpulist(local_cpulist)
+        except ValueError:
+            logger.debug(f"Cannot parse GPU local_cpulist {local_cpulist!r}; not binding")
+            return
+        if hasattr(os, "sched_getaffinity"):
+            # numactl rejects CPUs outside a restricted cpuset (SLURM, docker
+            # --cpuset-cpus, cgroup v2), so stay within the allowed ones
+            cpus &= os.sched_getaffinity(0)
+        if not cpus:
+            logger.debug("No GPU-local CPUs are available to this process; not binding")
+            return
+
+        cpulist = ",".join(str(cpu) for cpu in sorted(cpus))
+        self.launch_prefix = ["numactl", f"--physcpubind={cpulist}"]
+        if numa_node >= 0:
+            self.launch_prefix.append(f"--preferred={numa_node}")
+        self.launch_prefix.append("--")
+        logger.info(f"Binding to GPU-local CPUs {cpulist} (NUMA node {numa_node})")
+
+    @cached_property
+    def md_engine(self) -> str:
+        """The best available MD engine, detected on first use."""
+        path = self.env.get("PATH", "")
+        amberhome = self.env.get("AMBERHOME")
+        if amberhome:
+            # amber.sh puts $AMBERHOME/bin on PATH; look there before walking
+            # the rest of PATH (which may include slow network mounts)
+            path = os.pathsep.join((os.path.join(amberhome, "bin"), path))
+        engine = _select_md_engine(path, self.config.use_gpu, self.config.precision)
+        if engine is None:
+            raise RuntimeError("No Amber MD engine found")
+
+        if engine.startswith("pmemd.cuda"):
+            logger.info(f"Using GPU-accelerated {engine}")
+            if engine == "pmemd.cuda" and self.config.precision != "SPFP":
+                logger.warning(
+                    f"pmemd.cuda_{self.config.precision} not found; "
+                    "pmemd.cuda runs in SPFP precision"
+                )
+            logger.info(
+                "pmemd.cuda.MPI is not used: Amber does not scale a single "
+                "run across GPUs; run independent jobs per GPU instead"
             )
-            if result.returncode == 0:
-                self.md_engine = "pmemd.cuda"
-                logger.info("Using GPU-accelerated pmemd.cuda")
-                return self.md_engine
-
-        result = subprocess.run(
-            ["which", "pmemd"],
-            capture_output=True,
-            env=self.env,
-        )
-        if result.returncode == 0:
-            self.md_engine = "pmemd"
+        elif engine == "pmemd":
             logger.info("Using CPU pmemd")
-            return self.md_engine
-
-        result = subprocess.run(
-            ["which", "sander"],
-            capture_output=True,
-            env=self.env,
-        )
-        if result.returncode == 0:
-            self.md_engine = "sander"
+        else:
             logger.warning("Using sander (slower than pmemd)")
-            return self.md_engine
-
-        raise RuntimeError("No Amber MD engine found")
+        return engine
 
     def run_command(
         self,
         cmd: list[str],
         step_name: str,
         check_output: Optional[Path] = None,
+        log_name: Optional[str] = None,
+        stdin_text: Optional[str] = None,
     ) -> None:
-        """Run a command and check for success."""
-        logger.info(f"Running {step_name}...")
-
-        result = subprocess.run(
-            cmd,
-            env=self.env,
-            cwd=self.config.output_dir,
-            capture_output=True,
-            text=True,
-        )
-
-        if result.returncode != 0:
+        """Run a command, streaming its stdout/stderr to log files.
+
+        If stdin_text is given it is fed to the command on stdin; otherwise
+        stdin is closed so the child never reads the caller's stdin.
+        """
+        log_name = log_name or step_name.split()[0].lower()
+        stdout_log = self.config.output_dir / f"{log_name}.stdout.log"
+        stderr_log = self.config.output_dir / f"{log_name}.stderr.log"
+
+        # MD engines report progress in their -o file, other tools on stdout
+        progress = cmd[cmd.index("-o") + 1] if "-o" in cmd else stdout_log.name
+        logger.info(f"Running {step_name}... (progress: {self.config.output_dir / progress})")
+
+        with open(stdout_log, "wb") as out, open(stderr_log, "wb") as err:
+            # Run in its own session so an interrupt can stop the whole job
+            proc = subprocess.Popen(
+                cmd,
+                env=self.env,
+                cwd=self.config.output_dir,
+                stdin=subprocess.DEVNULL if stdin_text is None else subprocess.PIPE,
+                stdout=out,
+                stderr=err,
+                start_new_session=True,
+            )
+            try:
+                proc.communicate(None if stdin_text is None else stdin_text.encode())
+                returncode = proc.returncode
+            except KeyboardInterrupt:
+                os.killpg(proc.pid, signal.SIGTERM)
+                proc.wait()
+                raise
+
+        if returncode != 0:
             logger.error(f"{step_name} failed!")
-            logger.error(f"Stderr: {result.stderr}")
+            logger.error(f"Stderr tail:\n{_read_tail(stderr_log)}")
             raise RuntimeError(f"{step_name} failed")
 
         if check_output and not check_output.exists():
@@ -391,25 +809,98 @@ class SimulationRunner:
 
         logger.success(f"{step_name} completed")
 
+    def _stage_key(self, input_files: list[Path], in_text: str = "") -> str:
+        """Hash a stage's input files and parameters into a cache key."""
+        digest = hashlib.blake2b(digest_size=16)
+        for path in input_files:
+            with open(path, "rb") as f:
+                digest.update(hashlib.file_digest(f, "blake2b").digest())
+        digest.update(in_text.encode())
+        return digest.hexdigest()
+
+    def _run_cached(
+        self,
+        stage: str,
+        inputs: list[str],
+        outputs: list[str],
+        run: Callable[[], None],
+        in_text: str = "",
+    ) -> None:
+        """Run a stage, or restore its outputs if its inputs are unchanged.
+
+        Outputs are stored in output_dir/.cache under a hash of the input
+        files (relative to output_dir) and in_text (the tleap script, or
+        the MD engine for MD stages).
+        """
+        if not self.config.stage_cache:
+            run()
+            return
+
+        out_dir = self.config.output_dir
+        cache_dir = out_dir / ".cache"
+        key = self._stage_key(
+            [out_dir / name for name in inputs],
+            in_text,
+        )
+        cached = [cache_dir / f"{stage}.{key}.{name}" for name in outputs]
+
+        if all(path.exists() for path in cached):
+            for path, name in zip(cached, outputs):
+                shutil.copyfile(path, out_dir / name)
+            logger.info(f"Cached {stage}, skipping")
+            return
+
+        run()
+        cache_dir.mkdir(exist_ok=True)
+        # Keep only the newest entry per stage so .cache does not keep growing
+        current = f"{stage}.{key}."
+        for old in cache_dir.glob(f"{stage}.*"):
+            if not old.name.startswith(current):
+                old.unlink(missing_ok=True)
+        for path, name in zip(cached, outputs):
+            # Missing outputs are reported by the stage's own checks
+            if (out_dir / name).exists():
+                shutil.copyfile(out_dir / name, path)
+
     def run_tleap(self) -> int:
         """Run tleap to prepare the system. Returns atom count."""
-        cmd = ["tleap", "-f", "tleap.in"]
-        self.run_command(cmd, "tleap")
+        # tleap reads its script sequentially, so it is piped in directly;
+        # tleap.in is still written as a record of the run
+        tleap_input = InputFileGenerator(self.config).generate_tleap_input()
+        if os.name == "nt":
+            # No /dev/stdin on Windows: read the tleap.in written with the inputs
+            cmd, stdin_text = ["tleap", "-f", "tleap.in"], None
+        else:
+            cmd, stdin_text = ["tleap", "-f", "/dev/stdin"], tleap_input
+        self._run_cached(
+            "tleap",
+            [str(self.config.pdb_file)],
+            ["system.prmtop", "system.inpcrd", "system.pdb"],
+            lambda: self.run_command(cmd, "tleap", log_name="tleap", stdin_text=stdin_text),
+            in_text=tleap_input,
+        )
 
         prmtop = self.config.output_dir / "system.prmtop"
         inpcrd = self.config.output_dir / "system.inpcrd"
 
         if not prmtop.exists() or not inpcrd.exists():
+            log_file = self.config.output_dir / "tleap.stdout.log"
+            if log_file.exists():
+                logger.error(f"tleap log tail:\n{_read_tail(log_file)}")
             raise RuntimeError("tleap failed to create output files")
 
-        system_pdb = self.config.output_dir / "system.pdb"
-        natoms = 0
-        if system_pdb.exists():
-            natoms = sum(
-                1 for line in system_pdb.read_text().splitlines()
-                if line.startswith("ATOM")
-            )
-        return natoms
+        return _read_prmtop_natom(prmtop)
+
+    def run_hmr(self) -> None:
+        """Repartition hydrogen masses in system.prmtop with ParmEd."""
+        cmd = ["parmed", "-O", "-p", "system.prmtop", "-i", "hmr.in"]
+        self._run_cached(
+            "hmr",
+            ["system.prmtop", "hmr.in"],
+            ["system.prmtop"],
+            lambda: self.run_command(cmd, "Hydrogen mass repartitioning",
+                                     self.config.output_dir / "system.prmtop", log_name="hmr"),
+        )
 
     def run_minimization(self, stage: int = 1) -> None:
         """Run energy minimization."""
@@ -425,7 +916,7 @@ class SimulationRunner:
             step_name = "Minimization (no restraints)"
 
         cmd = [
-            self.md_engine, "-O",
+            *self.launch_prefix, self.md_engine, "-O", *self.engine_args,
             "-i", input_file,
             "-o", f"{output_file}.out",
             "-p", "system.prmtop",
@@ -433,12 +924,19 @@ class SimulationRunner:
             "-r", restart,
         ] + extra_args
 
-        self.run_command(cmd, step_name, self.config.output_dir / restart)
+        self._run_cached(
+            output_file,
+            [input_file, "system.prmtop", coords],
+            [restart, f"{output_file}.out"],
+            lambda: self.run_command(cmd, step_name, self.config.output_dir / restart,
+                                     log_name=output_file),
+            in_text=self.md_engine,
+        )
 
     def run_heating(self) -> None:
         """Run heating simulation (NVT)."""
         cmd = [
-            self.md_engine, "-O",
+            *self.launch_prefix, self.md_engine, "-O", *self.engine_args,
             "-i", "heat.in",
             "-o", "heat.out",
             "-p", "system.prmtop",
@@ -447,13 +945,19 @@ class SimulationRunner:
             "-x", "heat.nc",
             "-ref", "min2.rst7",
         ]
-        self.run_command(cmd, f"Heating (0 -> {self.config.temperature} K)",
-                         self.config.output_dir / "heat.rst7")
+        self._run_cached(
+            "heat",
+            ["heat.in", "system.prmtop", "min2.rst7"],
+            ["heat.rst7", "heat.out"],
+            lambda: self.run_command(cmd, f"Heating (0 -> {self.config.temperature} K)",
+                                     self.config.output_dir / "heat.rst7", log_name="heat"),
+            in_text=self.md_engine,
+        )
 
     def run_equilibration(self) -> None:
         """Run equilibration simulation (NPT)."""
         cmd = [
-            self.md_engine, "-O",
+            *self.launch_prefix, self.md_engine, "-O", *self.engine_args,
             "-i", "equil.in",
             "-o", "equil.out",
             "-p", "system.prmtop",
@@ -462,13 +966,22 @@ class SimulationRunner:
             "-x", "equil.nc",
             "-ref", "heat.rst7",
         ]
-        self.run_command(cmd, "Equilibration (NPT, 500 ps)",
-                         self.config.output_dir / "equil.rst7")
+        outputs = ["equil.rst7", "equil.out"]
+        if self.config.equil_trajectory:
+            outputs.append("equil.nc")
+        self._run_cached(
+            "equil",
+            ["equil.in", "system.prmtop", "heat.rst7"],
+            outputs,
+            lambda: self.run_command(cmd, "Equilibration (NPT, 500 ps)",
+                                     self.config.output_dir / "equil.rst7", log_name="equil"),
+            in_text=self.md_engine,
+        )
 
     def run_production(self) -> None:
-        """Run production MD simulation (NPT)."""
+        """Run production MD simulation (NPT). Never cached."""
         cmd = [
-            self.md_engine, "-O",
+            *self.launch_prefix, self.md_engine, "-O", *self.engine_args,
             "-i", "prod.in",
             "-o", "prod.out",
             "-p", "system.prmtop",
@@ -477,61 +990,90 @@ class SimulationRunner:
             "-x", "prod.nc",
         ]
         self.run_command(cmd, f"Production MD (NPT, {self.config.sim_time_ns} ns)",
-                         self.config.output_dir / "prod.rst7")
-
-
-@simulation_mcp.tool
-def amber_run_protein_md(
-    pdb_file: Annotated[str, "Path to input PDB file containing the protein structure"],
-    job_name: Annotated[str | None, "Job name for output files (default: derived from PDB filename)"] = None,
-    sim_time_ns: Annotated[float, "Production simulation time in nanoseconds"] = 10.0,
-    temperature: Annotated[float, "Simulation temperature in Kelvin"] = 300.0,
-    box_buffer: Annotated[float, "Water box buffer size in Angstroms"] = 12.0,
-    salt_conc: Annotated[float, "Salt concentration in Molar (for ion addition)"] = 0.15,
-    forcefield: Annotated[str, "Force field to use: 'ff14SB' or 'ff19SB'"] = "ff19SB",
-    water_model: Annotated[str, "Water model: 'tip3p', 'opc', or 'tip4pew'"] = "opc",
-    use_gpu: Annotated[bool, "Use GPU acceleration with pmemd.cuda if available"] = True,
-    gpu_device: Annotated[str, "GPU device to use (e.g., 'cuda:0', 'cuda:1', or just '0', '1')"] = "cuda:0",
-    output_dir: Annotated[str | None, "Output directory path (default: results/md_<jobname>_<timestamp>)"] = None,
-    dry_run: Annotated[bool, "Generate input files only without running simulations"] = False,
-) -> dict:
-    """
-    Run a complete MD simulation workflow for a single protein.
-
-    This tool performs the full Amber MD simulation pipeline:
-    1. System preparation with tleap (solvation, ion addition)
-    2. Energy minimization (with and without restraints)
-    3. Heating from 0K to target temperature (NVT)
-    4. Equilibration at constant pressure (NPT, 500 ps)
-    5. Production MD at constant pressure (NPT)
-
-    Input is a PDB file, output is trajectory files and restart files for analysis.
-    """
-    logger.info("=" * 60)
-    logger.info("Amber MD Simulation - Single Protein Workflow")
-    logger.info("=" * 60)
-
-    # Validate PDB file
-    pdb_path = Path(pdb_file)
-    if not pdb_path.exists():
-        raise FileNotFoundError(f"PDB file not found: {pdb_file}")
-
-    # Create configuration
-    config = SimulationConfig(
-        pdb_file=pdb_path,
-        job_name=job_name or "",
-        sim_time_ns=sim_time_ns,
-        temperature=temperature,
-        box_buffer=box_buffer,
-        salt_conc=salt_conc,
-        forcefield=forcefield,
-        water_model=water_model,
-        use_gpu=use_gpu,
-        gpu_device=gpu_device,
-        dry_run=dry_run,
-        output_dir=Path(output_dir) if output_dir else Path("."),
-    )
-
+                         self.config.output_dir / "prod.rst7", log_name="prod")
+
+    def fit_cutoff_to_box(self, generator: InputFileGenerator) -> None:
+        """Adapt the cutoff and engine flags to a small solvated box.
+
+        pmemd requires cut + skinnb to fit in half of the shortest box side.
+        If system.inpcrd is smaller than that, the minimization and MD
+        inputs are rewritten with the largest cutoff that fits. The box is
+        taken NPT_BOX_MARGIN smaller than built, since it shrinks during
+        equilibration. pmemd.cuda also refuses boxes under three pair-list
+        cells per side unless it is run with -AllowSmallBox.
+        """
+        box = _parse_inpcrd_box(self.config.output_dir / "system.inpcrd")
+        if box is None:
+            logger.debug("No periodic box found in system.inpcrd; cutoff unchanged")
+            return
+
+        side = NPT_BOX_MARGIN * min(box)
+        max_cut = int((side / 2 - PAIRLIST_SKIN) * 10) / 10
+        if max_cut <= 0:
+            raise RuntimeError(
+                f"Box side {min(box):.1f} A is too small for any cutoff; "
+                "increase the box buffer"
+            )
+        if max_cut < DEFAULT_CUTOFF:
+            if max_cut < 8.0:
+                logger.warning(
+                    f"Box side {min(box):.1f} A only allows a {max_cut} A cutoff; "
+                    "consider a larger box buffer"
+                )
+
+            generator.cut = max_cut
+            files = {
+                "min.in": generator.generate_minimization_input(with_restraints=True),
+                "min2.in": generator.generate_minimization_input(with_restraints=False),
+                "heat.in": generator.generate_heating_input(),
+                "equil.in": generator.generate_equilibration_input(),
+                "prod.in": generator.generate_production_input(),
+            }
+            for filename, content in files.items():
+                (self.config.output_dir / filename).write_bytes(content.encode())
+            logger.info(f"Cutoff reduced to {max_cut} A for a {min(box):.1f} A box side")
+
+        if self.md_engine.startswith("pmemd.cuda") and side < 3 * (generator.cut + PAIRLIST_SKIN):
+            self.engine_args = ["-AllowSmallBox"]
+            logger.info(f"Running pmemd.cuda with -AllowSmallBox for a {min(box):.1f} A box side")
+
+    def limit_trajectory_to_solute(self, generator: InputFileGenerator) -> None:
+        """Rewrite prod.in so the trajectory holds only the solute (ntwprt).
+
+        tleap writes the solute first, so the solute is the atoms before
+        the first water or ion in system.pdb.
+        """
+        n_solute = _count_solute_atoms(self.config.output_dir / "system.pdb")
+        if n_solute == 0:
+            logger.warning("No solute atoms found in system.pdb; writing all atoms to prod.nc")
+            return
+
+        generator.n_solute = n_solute
+        (self.config.output_dir / "prod.in").write_bytes(
+            generator.generate_production_input().encode()
+        )
+        logger.info(f"Production trajectory limited to {n_solute} solute atoms")
+
+    def run_md_stages(self) -> None:
+        """Run minimization, heating, equilibration and production in order.
+
+        Each stage restarts from the previous stage's restart file, so the
+        stages run sequentially in one engine process each (pmemd's
+        ``-groupfile`` runs replicas concurrently and cannot chain them).
+        """
+        generator = InputFileGenerator(self.config)
+        self.fit_cutoff_to_box(generator)
+        if self.config.solute_trajectory:
+            self.limit_trajectory_to_solute(generator)
+        self.run_minimization(stage=1)
+        self.run_minimization(stage=2)
+        self.run_heating()
+        self.run_equilibration()
+        self.run_production()
+
+
+def _run_protein_md(config: SimulationConfig) -> dict:
+    """Run the full MD workflow for one configuration and build the tool result."""
     # Log configuration
     logger.info(f"Input PDB: {config.pdb_file}")
     logger.info(f"Job name: {config.job_name}")
@@ -541,7 +1083,9 @@ def amber_run_protein_md(
     logger.info(f"Temperature: {config.temperature} K")
     logger.info(f"Box buffer: {config.box_buffer} A")
     logger.info(f"Simulation time: {config.sim_time_ns} ns")
+    logger.info(f"HMR (4 fs timestep): {config.hmr}")
     logger.info(f"GPU device: {config.gpu_device} (CUDA device: {config.cuda_device_id})")
+    logger.info(f"GPU precision: {config.precision}")
     logger.info(f"Dry run: {config.dry_run}")
 
     # Create output directory
@@ -565,44 +1109,47 @@ def amber_run_protein_md(
                 "temperature": config.temperature,
                 "sim_time_ns": config.sim_time_ns,
                 "gpu_device": config.gpu_device,
+                "hmr": config.hmr,
             }
         }
 
     # Run simulation
     runner = SimulationRunner(config)
     runner.setup_environment()
-    runner.detect_md_engine()
 
     # Execute workflow
     natoms = runner.run_tleap()
     logger.success(f"System prepared: {natoms} atoms")
+    if config.hmr:
+        runner.run_hmr()
     artifacts.append({
         "description": "Topology file",
-        "path": str((config.output_dir / "system.prmtop").resolve())
+        "path": str(config.output_dir / "system.prmtop")
     })
     artifacts.append({
         "description": "Initial coordinates",
-        "path": str((config.output_dir / "system.inpcrd").resolve())
+        "path": str(config.output_dir / "system.inpcrd")
     })
 
-    runner.run_minimization(stage=1)
-    runner.run_minimization(stage=2)
-    runner.run_heating()
-    runner.run_equilibration()
-    runner.run_production()
+    runner.run_md_stages()
 
     # Add production outputs to artifacts
     artifacts.append({
-        "description": "Production trajectory (NetCDF)",
-        "path": str((config.output_dir / "prod.nc").resolve())
+        "description": (
+            "Production trajectory (NetCDF, solute atoms only; strip water/ions "
+            "from system.prmtop to analyze it)"
+            if config.solute_trajectory
+            else "Production trajectory (NetCDF)"
+        ),
+        "path": str(config.output_dir / "prod.nc")
     })
     artifacts.append({
         "description": "Final restart file",
-        "path": str((config.output_dir / "prod.rst7").resolve())
+        "path": str(config.output_dir / "prod.rst7")
     })
     artifacts.append({
         "description": "Production output log",
-        "path": str((config.output_dir / "prod.out").resolve())
+        "path": str(config.output_dir / "prod.out")
     })
 
     logger.success("MD simulation completed successfully!")
@@ -618,12 +1165,170 @@ def amber_run_protein_md(
             "temperature": config.temperature,
             "sim_time_ns": config.sim_time_ns,
             "gpu_device": config.gpu_device,
+            "hmr": config.hmr,
             "natoms": natoms,
             "md_engine": runner.md_engine,
         }
     }
 
 
+
+@simulation_mcp.tool
+def amber_run_protein_md(
+    pdb_file: Annotated[str, "Path to input PDB file containing the protein structure"],
+    job_name: Annotated[str | None, "Job name for output files (default: derived from PDB filename)"] = None,
+    sim_time_ns: Annotated[float, "Production simulation time in nanoseconds"] = 10.0,
+    temperature: Annotated[float, "Simulation temperature in Kelvin"] = 300.0,
+    box_buffer: Annotated[float, "Water box buffer size in Angstroms"] = 12.0,
+    salt_conc: Annotated[float, "Salt concentration in Molar (for ion addition)"] = 0.15,
+    forcefield: Annotated[str, "Force field to use: 'ff14SB' or 'ff19SB'"] = "ff19SB",
+    water_model: Annotated[str, "Water model: 'tip3p', 'opc', or 'tip4pew'"] = "opc",
+    use_gpu: Annotated[bool, "Use GPU acceleration with pmemd.cuda if available"] = True,
+    gpu_device: Annotated[str, "GPU device to use (e.g., 'cuda:0', 'cuda:1', or just '0', '1')"] = "cuda:0",
+    precision: Annotated[str, "pmemd.cuda precision model: 'SPFP' (default, fastest), 'DPFP' or 'SPXP'"] = "SPFP",
+    hmr: Annotated[bool, "Use hydrogen mass repartitioning with a 4 fs timestep"] = True,
+    equil_trajectory: Annotated[bool, "Also write an equilibration trajectory (equil.nc, every 5 ps)"] = False,
+    run_tleap_check: Annotated[bool, "Run tleap's structure check (disable for already validated inputs)"] = True,
+    stage_cache: Annotated[bool, "Reuse outputs of unchanged stages from <output_dir>/.cache (production always runs; only when output_dir is given)"] = True,
+    solute_trajectory: Annotated[bool, "Write only solute atoms (no water/ions) to prod.nc to cut trajectory size"] = False,
+    output_dir: Annotated[str | None, "Output directory path (default: results/md_<jobname>_<timestamp>_<n>)"] = None,
+    dry_run: Annotated[bool, "Generate input files only without running simulations"] = False,
+) -> dict:
+    """
+    Run a complete MD simulation workflow for a single protein.
+
+    This tool performs the full Amber MD simulation pipeline:
+    1. System preparation with tleap (solvation, ion addition)
+    2. Energy minimization (with and without restraints)
+    3. Heating from 0K to target temperature (NVT)
+    4. Equilibration at constant pressure (NPT, 500 ps)
+    5. Production MD at constant pressure (NPT)
+
+    With hmr enabled (default), hydrogen masses are repartitioned after tleap
+    so equilibration and production can use a 4 fs timestep.
+
+    Input is a PDB file, output is trajectory files and restart files for analysis.
+    """
+    logger.info("=" * 60)
+    logger.info("Amber MD Simulation - Single Protein Workflow")
+    logger.info("=" * 60)
+
+    # Create configuration
+    config = SimulationConfig(
+        pdb_file=Path(pdb_file),
+        job_name=job_name or "",
+        sim_time_ns=sim_time_ns,
+        temperature=temperature,
+        box_buffer=box_buffer,
+        salt_conc=salt_conc,
+        forcefield=forcefield,
+        water_model=water_model,
+        use_gpu=use_gpu,
+        gpu_device=gpu_device,
+        precision=precision,
+        hmr=hmr,
+        equil_trajectory=equil_trajectory,
+        run_tleap_check=run_tleap_check,
+        stage_cache=stage_cache,
+        solute_trajectory=solute_trajectory,
+        dry_run=dry_run,
+        output_dir=Path(output_dir) if output_dir else Path("."),
+    )
+
+    return _run_protein_md(config)
+
+
+@simulation_mcp.tool
+def amber_run_protein_md_batch(
+    pdb_files: Annotated[list[str], "Paths to input PDB files (one simulation each)"],
+    sim_time_ns: Annotated[float, "Production simulation time in nanoseconds"] = 10.0,
+    temperature: Annotated[float, "Simulation temperature in Kelvin"] = 300.0,
+    box_buffer: Annotated[float, "Water box buffer size in Angstroms"] = 12.0,
+    salt_conc: Annotated[float, "Salt concentration in Molar (for ion addition)"] = 0.15,
+    forcefield: Annotated[str, "Force field to use: 'ff14SB' or 'ff19SB'"] = "ff19SB",
+    water_model: Annotated[str, "Water model: 'tip3p', 'opc', or 'tip4pew'"] = "opc",
+    gpu_devices: Annotated[list[str] | None, "GPU indices to use (default: CUDA_VISIBLE_DEVICES, else all GPUs listed by nvidia-smi)"] = None,
+    precision: Annotated[str, "pmemd.cuda precision model: 'SPFP' (default, fastest), 'DPFP' or 'SPXP'"] = "SPFP",
+    hmr: Annotated[bool, "Use hydrogen mass repartitioning with a 4 fs timestep"] = True,
+    solute_trajectory: Annotated[bool, "Write only solute atoms (no water/ions) to prod.nc to cut trajectory size"] = False,
+    output_dir: Annotated[str | None, "Parent directory for the per-protein md_<name> directories (default: results/); repeated file names get their parent directory prepended"] = None,
+) -> dict:
+    """
+    Run the complete MD workflow for many proteins in parallel across GPUs.
+
+    Each PDB file runs the same pipeline as amber_run_protein_md on a single
+    GPU. Runs are independent, so they are spread over the available GPUs
+    with one simulation per GPU at a time; Amber does not speed up a single
+    run across GPUs.
+
+    Failed simulations are reported per job and do not stop the others.
+    """
+    logger.info("=" * 60)
+    logger.info("Amber MD Simulation - Batch Workflow")
+    logger.info("=" * 60)
+
+    if not pdb_files:
+        raise ValueError("No PDB files given")
+
+    gpus = gpu_devices or _detect_gpus()
+    if not gpus:
+        raise RuntimeError("No GPUs found (pass gpu_devices to specify them explicitly)")
+
+    # Validate every input before starting any simulation
+    paths = [Path(pdb_file) for pdb_file in pdb_files]
+    configs = [
+        SimulationConfig(
+            pdb_file=path,
+            job_name=name,
+            sim_time_ns=sim_time_ns,
+            temperature=temperature,
+            box_buffer=box_buffer,
+            salt_conc=salt_conc,
+            forcefield=forcefield,
+            water_model=water_model,
+            hmr=hmr,
+            solute_trajectory=solute_trajectory,
+            precision=precision,
+            output_dir=Path(output_dir) / f"md_{name}" if output_dir else Path("."),
+        )
+        for path, name in zip(paths, _unique_job_names(paths))
+    ]
+    logger.info(f"Running {len(configs)} simulations on GPUs {', '.join(gpus)}")
+
+    # Each worker borrows a GPU for the duration of one simulation
+    free_gpus: "queue.Queue[str]" = queue.Queue()
+    for gpu in gpus:
+        free_gpus.put(gpu)
+
+    def run_on_free_gpu(config: SimulationConfig) -> dict:
+        gpu = free_gpus.get()
+        try:
+            return _run_protein_md(replace(config, gpu_device=gpu))
+        finally:
+            free_gpus.put(gpu)
+
+    jobs = []
+    artifacts = []
+    with ThreadPoolExecutor(max_workers=min(len(gpus), len(configs))) as executor:
+        futures = [executor.submit(run_on_free_gpu, config) for config in configs]
+        for config, future in zip(configs, futures):
+            try:
+                result = future.result()
+            except Exception as e:
+                logger.error(f"[{config.job_name}] Failed: {e}")
+                jobs.append({"job_name": config.job_name, "status": "failed", "error": str(e)})
+                continue
+            artifacts.extend(result["artifacts"])
+            jobs.append({"job_name": config.job_name, "status": "completed", **result["config"]})
+
+    n_failed = sum(job["status"] == "failed" for job in jobs)
+    return {
+        "message": f"Batch MD completed: {len(jobs) - n_failed} of {len(jobs)} simulations succeeded",
+        "artifacts": artifacts,
+        "jobs": jobs,
+    }
+
+
 @simulation_mcp.tool
 def amber_prepare_system(
     pdb_file: Annotated[str, "Path to input PDB file containing the protein structure"],
@@ -631,6 +1336,8 @@ def amber_prepare_system(
     box_buffer: Annotated[float, "Water box buffer size in Angstroms"] = 12.0,
     forcefield: Annotated[str, "Force field: 'ff14SB' or 'ff19SB'"] = "ff19SB",
     water_model: Annotated[str, "Water model: 'tip3p', 'opc', or 'tip4pew'"] = "opc",
+    run_tleap_check: Annotated[bool, "Run tleap's structure check (disable for already validated inputs)"] = True,
+    hmr: Annotated[bool, "Repartition hydrogen masses in the topology (for 4 fs timesteps)"] = False,
     output_dir: Annotated[str | None, "Output directory path"] = None,
 ) -> dict:
     """
@@ -641,6 +1348,7 @@ def amber_prepare_system(
     2. Apply force field parameters
     3. Solvate in a water box
     4. Add neutralizing ions
+    5. Repartition hydrogen masses with ParmEd (only when hmr is enabled)
 
     Output is topology (.prmtop) and coordinate (.inpcrd) files ready for simulation.
     """
@@ -648,16 +1356,14 @@ def amber_prepare_system(
     logger.info("Amber System Preparation with tleap")
     logger.info("=" * 60)
 
-    pdb_path = Path(pdb_file)
-    if not pdb_path.exists():
-        raise FileNotFoundError(f"PDB file not found: {pdb_file}")
-
     config = SimulationConfig(
-        pdb_file=pdb_path,
+        pdb_file=Path(pdb_file),
         job_name=job_name or "",
         box_buffer=box_buffer,
         forcefield=forcefield,
         water_model=water_model,
+        run_tleap_check=run_tleap_check,
+        hmr=hmr,
         output_dir=Path(output_dir) if output_dir else Path("."),
     )
 
@@ -667,18 +1373,21 @@ def amber_prepare_system(
     generator = InputFileGenerator(config)
     tleap_content = generator.generate_tleap_input()
     tleap_file = config.output_dir / "tleap.in"
-    tleap_file.write_text(tleap_content)
+    tleap_file.write_bytes(tleap_content.encode())
 
     # Run tleap
     runner = SimulationRunner(config)
-    runner.setup_environment()
+    runner.setup_environment(detect_engine=False)
     natoms = runner.run_tleap()
+    if config.hmr:
+        (config.output_dir / "hmr.in").write_bytes(HMR_INPUT_BYTES)
+        runner.run_hmr()
 
     artifacts = [
-        {"description": "tleap input", "path": str(tleap_file.resolve())},
-        {"description": "Topology file", "path": str((config.output_dir / "system.prmtop").resolve())},
-        {"description": "Coordinate file", "path": str((config.output_dir / "system.inpcrd").resolve())},
-        {"description": "Solvated PDB", "path": str((config.output_dir / "system.pdb").resolve())},
+        {"description": "tleap input", "path": str(tleap_file)},
+        {"description": "Topology file", "path": str(config.output_dir / "system.prmtop")},
+        {"description": "Coordinate file", "path": str(config.output_dir / "system.inpcrd")},
+        {"description": "Solvated PDB", "path": str(config.output_dir / "system.pdb")},
     ]
 
     logger.success(f"System prepared: {natoms} atoms")
@@ -692,6 +1401,7 @@ def amber_prepare_system(
             "forcefield": config.forcefield,
             "water_model": config.water_model,
             "box_buffer": config.box_buffer,
+            "hmr": config.hmr,
             "natoms": natoms,
         }
     }
@@ -706,6 +1416,8 @@ def amber_generate_input_files(
     box_buffer: Annotated[float, "Water box buffer size in Angstroms"] = 12.0,
     forcefield: Annotated[str, "Force field: 'ff14SB' or 'ff19SB'"] = "ff19SB",
     water_model: Annotated[str, "Water model: 'tip3p', 'opc', or 'tip4pew'"] = "opc",
+    hmr: Annotated[bool, "Use hydrogen mass repartitioning with a 4 fs timestep"] = True,
+    equil_trajectory: Annotated[bool, "Also write an equilibration trajectory (equil.nc, every 5 ps)"] = False,
     output_dir: Annotated[str | None, "Output directory path"] = None,
 ) -> dict:
     """
@@ -717,6 +1429,7 @@ def amber_generate_input_files(
     - heat.in: Heating input (NVT)
     - equil.in: Equilibration input (NPT)
     - prod.in: Production MD input (NPT)
+    - hmr.in: ParmEd hydrogen mass repartitioning input (when hmr is enabled)
 
     Use this to inspect or customize input files before running simulations.
     """
@@ -724,18 +1437,16 @@ def amber_generate_input_files(
     logger.info("Generating Amber Input Files")
     logger.info("=" * 60)
 
-    pdb_path = Path(pdb_file)
-    if not pdb_path.exists():
-        raise FileNotFoundError(f"PDB file not found: {pdb_file}")
-
     config = SimulationConfig(
-        pdb_file=pdb_path,
+        pdb_file=Path(pdb_file),
         job_name=job_name or "",
         sim_time_ns=sim_time_ns,
         temperature=temperature,
         box_buffer=box_buffer,
         forcefield=forcefield,
         water_model=water_model,
+        hmr=hmr,
+        equil_trajectory=equil_trajectory,
         output_dir=Path(output_dir) if output_dir else Path("."),
     )
 
@@ -756,6 +1467,7 @@ def amber_generate_input_files(
             "water_model": config.water_model,
             "temperature": config.temperature,
             "sim_time_ns": config.sim_time_ns,
-            "nsteps_production": int(config.sim_time_ns * 500000),
+            "hmr": config.hmr,
+            "nsteps_production": int(config.sim_time_ns * generator.steps_per_ns()),
         }
     }